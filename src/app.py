@@ -3,16 +3,35 @@ FastAPI microservice wrapping the InsightFace attendance system.
 
 Endpoints:
   POST /register          — register a student's face into ChromaDB
+  POST /register-batch    — register many students from a zip or files + manifest
   POST /detect            — detect faces in a photo, return roll numbers only
+  POST /detect-video      — deduplicated roll numbers from a clip or burst of frames
   POST /detect-and-mark   — detect faces then call Django to mark attendance
+                            (mode=async returns a job id immediately)
+  GET  /jobs/{id}         — status, stage and result of an async job
+  GET  /jobs/{id}/events  — the same as server-sent events, until the job finishes
+  GET  /ready             — 200 once models are loaded and warm, else 503
+  GET  /stats             — runtime counters (recognition batch sizes, cache hits, ...)
+  GET  /metrics           — Prometheus metrics (route latency, stage timings, faces, queues)
 """
 
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import json
 import os
-import tempfile
+import threading
+import time
+import zipfile
+from contextlib import asynccontextmanager
 
 import httpx
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+import numpy as np
+from fastapi import FastAPI, File, Form, HTTPException, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 
 try:
     from dotenv import load_dotenv
@@ -20,10 +39,66 @@ try:
 except ImportError:
     pass
 
+from django_client import DjangoClient
+from gallery import RosterFilter
+from inference_pool import InferencePool
+from jobs import FINISHED, JobFailed, JobQueue, JobStore
+from metrics import Counter, Gauge, Histogram, Registry
 from orchestrator import AttendanceOrchestrator
+from quality import REASONS, QualityGate
 
 
-app = FastAPI(title="Face Recognition Attendance Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Own the inference pool, the Django client and the async job queue: start
+    them with the app, drain and close them on shutdown.
+
+    With EAGER_WARMUP on, models are loaded and warmed in the background right
+    away; the server answers /health meanwhile and /ready flips once done.
+    Otherwise the first /ready call starts the same warm-up.
+    """
+    global _pool, _django, _job_store, _jobs, _warmup
+    _pool = InferencePool(workers=INFERENCE_WORKERS, initializer=_init_inference_worker)
+    _django = DjangoClient(
+        DJANGO_BASE_URL,
+        max_connections=DJANGO_MAX_CONNECTIONS,
+        max_keepalive=DJANGO_MAX_KEEPALIVE,
+        connect_timeout_s=DJANGO_CONNECT_TIMEOUT_S,
+        read_timeout_s=DJANGO_TIMEOUT_S,
+        retries=DJANGO_RETRIES,
+    )
+    _job_store = JobStore(JOB_DB_PATH)
+    if RECOVER_INTERRUPTED_JOBS:
+        interrupted = _job_store.fail_interrupted()
+        if interrupted:
+            print(f"[WARN] Marked {interrupted} interrupted jobs as failed")
+        _job_store.purge(JOB_RETENTION_H * 3600)
+    _jobs = JobQueue(_job_store, _run_detect_and_mark_job, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE)
+    _jobs.start()
+    if EAGER_WARMUP:
+        _start_warm_up()
+    try:
+        yield
+    finally:
+        if _warmup is not None and not _warmup.done():
+            _warmup.cancel()
+        _warmup = None
+        # Queued and running async jobs are dropped and marked failed.
+        await _jobs.stop()
+        _jobs = None
+        # Let in-flight photos finish before the process exits.
+        _pool.shutdown(wait=True)
+        _pool = None
+        await _django.aclose()
+        _django = None
+        _job_store.close()
+        _job_store = None
+        if _orchestrator is not None:
+            _orchestrator.system.close()
+
+
+app = FastAPI(title="Face Recognition Attendance Service", lifespan=lifespan)
 
 # Allow all origins during development; tighten this in production.
 app.add_middleware(
@@ -36,9 +111,208 @@ app.add_middleware(
 # Django backend base URL — override via DJANGO_BASE_URL env var.
 DJANGO_BASE_URL: str = os.getenv("DJANGO_BASE_URL", "http://127.0.0.1:8000")
 
+# Connection pool and retry policy for calls to Django.
+DJANGO_MAX_CONNECTIONS: int = int(os.getenv("DJANGO_MAX_CONNECTIONS", "20"))
+DJANGO_MAX_KEEPALIVE: int = int(os.getenv("DJANGO_MAX_KEEPALIVE", "10"))
+DJANGO_CONNECT_TIMEOUT_S: float = float(os.getenv("DJANGO_CONNECT_TIMEOUT_S", "5"))
+DJANGO_TIMEOUT_S: float = float(os.getenv("DJANGO_TIMEOUT_S", "30"))
+DJANGO_RETRIES: int = int(os.getenv("DJANGO_RETRIES", "2"))
+
+# Largest photo accepted per upload, in bytes — override via MAX_UPLOAD_BYTES.
+MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Largest video clip accepted by /detect-video — override via MAX_VIDEO_UPLOAD_BYTES.
+MAX_VIDEO_UPLOAD_BYTES: int = int(os.getenv("MAX_VIDEO_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+# Largest zip archive accepted by /register-batch — override via MAX_BATCH_UPLOAD_BYTES.
+MAX_BATCH_UPLOAD_BYTES: int = int(os.getenv("MAX_BATCH_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+
+# Packed formats accepted by /match-embeddings, little-endian.
+EMBEDDING_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+# Request bodies are refused past the upload limit of their route plus this
+# much for the other form fields and multipart framing.
+_FORM_OVERHEAD_BYTES = 1024 * 1024
+_BODY_LIMITS = {
+    "/register-batch": MAX_BATCH_UPLOAD_BYTES,
+    "/detect-video": MAX_VIDEO_UPLOAD_BYTES,
+}
+
+# Number of photos processed concurrently — override via INFERENCE_WORKERS.
+# Each worker holds its own InsightFace model handle, so memory grows with it.
+INFERENCE_WORKERS: int = int(os.getenv("INFERENCE_WORKERS", "1"))
+
 # Load the face recognition system once at startup.
 # ctx_id=-1 uses CPU; set to 0 for GPU.
 _orchestrator: AttendanceOrchestrator | None = None
+_orchestrator_lock = threading.Lock()
+_pool: InferencePool | None = None
+_django: DjangoClient | None = None
+
+# Async /detect-and-mark jobs: SQLite file holding job status and results,
+# concurrent jobs, queued jobs before new ones are refused, and how long
+# finished jobs are kept.
+JOB_DB_PATH: str = os.getenv("JOB_DB_PATH", "./jobs.db")
+JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", str(INFERENCE_WORKERS)))
+JOB_QUEUE_SIZE: int = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_RETENTION_H: float = float(os.getenv("JOB_RETENTION_H", "24"))
+_job_store: JobStore | None = None
+# Fail jobs left over from a previous run at startup. serve.py does this once
+# in the parent and turns it off in the workers, which share the job store.
+RECOVER_INTERRUPTED_JOBS: bool = True
+_jobs: JobQueue | None = None
+
+# Load and warm the models at startup instead of on the first request.
+EAGER_WARMUP: bool = os.getenv("EAGER_WARMUP", "1") == "1"
+
+# Startup progress reported by /ready, and the task filling it in.
+_readiness: dict = {"ready": False, "error": None}
+_warmup: asyncio.Task | None = None
+
+
+# --------------------------------------------------------------------------- #
+#  Metrics                                                                     #
+# --------------------------------------------------------------------------- #
+
+METRICS = Registry()
+REQUEST_SECONDS = METRICS.register(Histogram(
+    "face_service_request_duration_seconds",
+    "HTTP request latency by route template, method and status code.",
+    ("route", "method", "status"),
+))
+STAGE_SECONDS = METRICS.register(Histogram(
+    "face_service_stage_duration_seconds",
+    "Time spent per photo in each stage: decode, detect, quality (gate), embed (alignment + recognition), "
+    "match (gallery query) and django (attendance call).",
+    ("stage",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+))
+FACES_PER_PHOTO = METRICS.register(Histogram(
+    "face_service_faces_per_photo",
+    "Faces detected per analysed photo.",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+))
+FACES_RECOGNIZED = METRICS.register(Counter(
+    "face_service_faces_recognized", "Detected faces matched to a registered student.",
+))
+FACES_UNRECOGNIZED = METRICS.register(Counter(
+    "face_service_faces_unrecognized", "Detected faces below the similarity threshold.",
+))
+FACES_SKIPPED = METRICS.register(Counter(
+    "face_service_faces_skipped", "Detected faces the quality gate kept from recognition, by reason.",
+    ("reason",),
+))
+for _reason in REASONS:
+    # Export every reason from the start, so rate() sees the first skip.
+    FACES_SKIPPED.inc(0, reason=_reason)
+METRICS.register(Gauge(
+    "face_service_gallery_size", "Registered students in the gallery.",
+    fn=lambda: _orchestrator.system.gallery_size() if _orchestrator is not None else None,
+    merge="max",  # serve.py workers share one gallery
+))
+METRICS.register(Gauge(
+    "face_service_inference_queue_depth", "Inference jobs waiting for a free worker.",
+    fn=lambda: _pool.queue_depth if _pool is not None else None,
+))
+METRICS.register(Gauge(
+    "face_service_inference_active", "Inference jobs currently running.",
+    fn=lambda: _pool.active if _pool is not None else None,
+))
+METRICS.register(Gauge(
+    "face_service_job_queue_depth", "Async /detect-and-mark jobs waiting to start.",
+    fn=lambda: _jobs.pending if _jobs is not None else None,
+))
+
+
+def _observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def _observe_photo(faces: int, recognized: int, unrecognized: int, skipped: dict):
+    FACES_PER_PHOTO.observe(faces)
+    FACES_RECOGNIZED.inc(recognized)
+    FACES_UNRECOGNIZED.inc(unrecognized)
+    for reason, count in skipped.items():
+        FACES_SKIPPED.inc(count, reason=reason)
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/jobs/{job_id}), not the raw path, to keep
+        # the number of series bounded.
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            route=route.path if route is not None else "unmatched",
+            method=request.method,
+            status=str(status),
+        )
+
+
+class BodySizeLimit:
+    """
+    ASGI middleware refusing request bodies over the route's upload limit
+    with a 413 before Starlette parses (and spools) the form.
+
+    A Content-Length over the limit is answered straight away; otherwise the
+    bytes are counted as they are received, so a chunked or mislabelled
+    upload is cut off as soon as it passes the limit.
+    """
+
+    def __init__(self, app, limits: dict[str, int], default: int):
+        self.app = app
+        self.limits = limits
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limits.get(scope["path"], self.default) + _FORM_OVERHEAD_BYTES
+        detail = f"Request body exceeds the {limit} byte limit."
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+        refused = started = False
+
+        async def limited_receive():
+            nonlocal received, refused
+            if refused:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Answer now and tell the app the client is gone, so it
+                    # stops reading; whatever it sends afterwards is dropped.
+                    refused = True
+                    if not started:
+                        await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if not refused:
+                started = True
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+app.add_middleware(BodySizeLimit, limits=_BODY_LIMITS, default=MAX_UPLOAD_BYTES)
 
 
 def get_orchestrator() -> AttendanceOrchestrator:
@@ -47,23 +321,355 @@ def get_orchestrator() -> AttendanceOrchestrator:
     Deferred so the model loads after FastAPI startup, not at import time.
     """
     global _orchestrator
-    if _orchestrator is None:
-        ctx_id = int(os.getenv("CTX_ID", "-1"))
-        _orchestrator = AttendanceOrchestrator(ctx_id=ctx_id)
+    with _orchestrator_lock:
+        if _orchestrator is None:
+            ctx_id = int(os.getenv("CTX_ID", "-1"))
+            modules = os.getenv("FACE_MODULES", "detection,recognition")
+            _orchestrator = AttendanceOrchestrator(
+                ctx_id=ctx_id,
+                modules=None if modules == "all" else tuple(m.strip() for m in modules.split(",")),
+                gallery_backend=os.getenv("GALLERY_BACKEND", "memory"),
+                gallery_dtype=os.getenv("GALLERY_DTYPE", "float32"),
+                batch_max_size=int(os.getenv("RECOGNITION_BATCH_SIZE", "32")),
+                batch_max_wait_ms=float(os.getenv("RECOGNITION_BATCH_WAIT_MS", "0")),
+                max_image_side=int(os.getenv("MAX_IMAGE_SIDE", "4096")),
+                adaptive_detection=os.getenv("ADAPTIVE_DETECTION", "1") == "1",
+                tile_size=int(os.getenv("TILE_SIZE", "1024")),
+                tile_workers=int(os.getenv("TILE_WORKERS", "1")),
+                cache_max_bytes=int(float(os.getenv("RESULT_CACHE_MB", "64")) * 1024 * 1024),
+                cache_ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "600")),
+                ort_threads=int(os.getenv("ORT_THREADS", "0")),
+                snapshot_path=os.getenv("GALLERY_SNAPSHOT") or None,
+                ivf_nlist=int(os.getenv("IVF_NLIST", "1024")),
+                ivf_nprobe=int(os.getenv("IVF_NPROBE", "64")),
+                pq_m=int(os.getenv("PQ_M", "16")),
+                ivf_refine=os.getenv("IVF_REFINE", "int8"),
+                quality_gate=QualityGate(
+                    min_det_score=float(os.getenv("QUALITY_MIN_DET_SCORE", "0")),
+                    min_face_px=int(os.getenv("QUALITY_MIN_FACE_PX", "0")),
+                    max_yaw_deg=float(os.getenv("QUALITY_MAX_YAW_DEG", "0")),
+                    min_blur=float(os.getenv("QUALITY_MIN_BLUR", "0")),
+                ),
+                stage_observer=_observe_stage,
+                photo_observer=_observe_photo,
+            )
     return _orchestrator
 
 
-def _save_upload_to_tempfile(upload: UploadFile) -> str:
+def _init_inference_worker():
+    """Thread-pool initializer: give each inference worker its own warmed model handle."""
+    get_orchestrator().system.init_worker()
+
+
+def _start_warm_up():
+    """Start the warm-up task once; later calls are no-ops."""
+    global _warmup
+    if _warmup is None:
+        _warmup = asyncio.create_task(_warm_up())
+
+
+async def _warm_up():
+    """Start every inference worker (loading and warming its models), then mark ready."""
+    started = time.perf_counter()
+    try:
+        await _pool.start()
+    except Exception as exc:
+        _readiness["error"] = f"{type(exc).__name__}: {exc}"
+        print(f"[ERROR] Warm-up failed: {_readiness['error']}")
+        return
+
+    _readiness["startup_s"] = round(time.perf_counter() - started, 3)
+    _readiness["ready"] = True
+    print(f"[INFO] Face service warm after {_readiness['startup_s']}s")
+
+
+async def _read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Read an uploaded file into memory, chunk by chunk, and return its bytes.
+
+    The face pipeline decodes straight from these bytes with cv2.imdecode.
+    BodySizeLimit has already bounded the whole request; this check applies
+    max_bytes to each file.
     """
-    Write an uploaded file to a temporary path on disk and return the path.
+    buffer = bytearray()
+    while chunk := await upload.read(_UPLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Uploaded file exceeds the {max_bytes} byte limit.",
+            )
+
+    if not buffer:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
+    return bytes(buffer)
 
-    The caller is responsible for deleting the file after use.
-    InsightFace requires a file path, not a file-like object.
+
+def _parse_numbers(value, count: int, field: str) -> list[float] | None:
+    """
+    Parse a list of count numbers given as a JSON list or a comma-separated
+    string; None or an empty string means not given.
     """
-    suffix = os.path.splitext(upload.filename or ".jpg")[-1] or ".jpg"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(upload.file.read())
-        return tmp.name
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    items = value if isinstance(value, list) else str(value).replace(";", ",").split(",")
+    try:
+        numbers = [float(item) for item in items]
+    except (TypeError, ValueError):
+        numbers = []
+    if len(numbers) != count:
+        raise ValueError(f"{field} needs {count} comma-separated numbers")
+    return numbers
+
+
+def _face_options(aligned, bbox, landmarks) -> dict:
+    """register_student's face location arguments from request fields."""
+    options = {"aligned": str(aligned).strip().lower() in ("1", "true", "yes"), "bbox": None, "kps": None}
+    options["bbox"] = _parse_numbers(bbox, 4, "bbox")
+    kps = _parse_numbers(landmarks, 10, "landmarks")
+    if kps is not None:
+        if options["bbox"] is None:
+            raise ValueError("landmarks need a bbox")
+        options["kps"] = [kps[i:i + 2] for i in range(0, 10, 2)]
+    if options["aligned"] and options["bbox"] is not None:
+        raise ValueError("give either aligned or bbox, not both")
+    return options
+
+
+def _parse_manifest(manifest: str) -> list[dict]:
+    """
+    Parse a /register-batch manifest into [{"filename", "roll_no", "name",
+    "branch", "year", "aligned", "bbox", "kps"}].
+
+    Accepts either a JSON list of objects or CSV with a header row naming the
+    filename, roll_no and name columns; branch and year columns are optional,
+    as are aligned, bbox and landmarks (see /register).
+    """
+    text = manifest.strip()
+    try:
+        rows = json.loads(text) if text.startswith("[") else list(csv.DictReader(io.StringIO(text)))
+    except (json.JSONDecodeError, csv.Error) as exc:
+        raise HTTPException(status_code=400, detail=f"Could not parse manifest: {exc}")
+
+    parsed = []
+    for line, row in enumerate(rows, start=1):
+        if not isinstance(row, dict) or not all(str(row.get(key) or "").strip() for key in ("filename", "roll_no", "name")):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Manifest entry {line} needs filename, roll_no and name.",
+            )
+        entry = {key: str(row[key]).strip() for key in ("filename", "roll_no", "name")}
+        entry["branch"] = str(row.get("branch") or "").strip() or None
+        try:
+            entry["year"] = int(row["year"]) if str(row.get("year") or "").strip() else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Manifest entry {line} has a non-numeric year.")
+        try:
+            entry.update(_face_options(row.get("aligned") or False, row.get("bbox"), row.get("landmarks")))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"Manifest entry {line}: {exc}.")
+        parsed.append(entry)
+
+    if not parsed:
+        raise HTTPException(status_code=400, detail="Manifest is empty.")
+    return parsed
+
+
+def _read_archive(data: bytes, wanted: set[str]) -> dict[str, bytes]:
+    """
+    Return {basename: bytes} for the files of a zip archive named in wanted,
+    skipping oversized members.
+
+    Nothing is inflated until the declared sizes of every wanted member have
+    been checked, so a zip bomb is rejected without being expanded. Reading
+    a member stops at its declared size.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Archive is not a valid zip file.")
+
+    with archive:
+        selected = {}
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name not in wanted:
+                continue
+            if name in selected:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Archive holds more than one file named {name} "
+                           f"({selected[name].filename}, {info.filename}).",
+                )
+            selected[name] = info
+
+        selected = {name: info for name, info in selected.items() if info.file_size <= MAX_UPLOAD_BYTES}
+        total = sum(info.file_size for info in selected.values())
+        if total > MAX_BATCH_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Archive expands to {total} bytes, over the {MAX_BATCH_UPLOAD_BYTES} byte limit.",
+            )
+        return {name: archive.read(info) for name, info in selected.items()}
+
+
+def _roster_filter(roster: str | None, branch: str | None, year: int | None) -> RosterFilter | None:
+    """Build a RosterFilter from the optional form fields, or None when none are set."""
+    rolls = [roll.strip() for roll in (roster or "").split(",") if roll.strip()]
+    roster_filter = RosterFilter(rolls or None, (branch or "").strip() or None, year)
+    return roster_filter or None
+
+
+async def _run_inference(method, *args, **kwargs):
+    """
+    Run an AttendanceOrchestrator method on the inference pool.
+
+    The event loop stays free while the photo is processed. Undecodable
+    uploads surface from the pipeline as ValueError and become a 400.
+    """
+    def call():
+        return method(get_orchestrator(), *args, **kwargs)
+
+    try:
+        return await _pool.run(call)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def _run_matching(method, *args, **kwargs):
+    """
+    Run an AttendanceOrchestrator method that only searches the gallery.
+
+    Like _run_inference, but on the event loop's default executor: no model
+    runs, so matching must not queue behind photos on the inference pool.
+    """
+    def call():
+        return method(get_orchestrator(), *args, **kwargs)
+
+    try:
+        return await asyncio.to_thread(call)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+async def _recognise(
+    image: bytes,
+    threshold: float,
+    tiled: bool,
+    roster: RosterFilter | None,
+    annotate: bool = False,
+    progress=None,
+) -> tuple[list, dict]:
+    """
+    Attendance records for a photo, from a single inference.
+
+    With annotate, the second value is {"annotated_image": <base64 JPEG>}
+    with the recognised roll numbers drawn on; otherwise it is empty.
+    """
+    if not annotate:
+        results = await _run_inference(
+            AttendanceOrchestrator.mark, image, threshold=threshold, tiled=tiled,
+            roster=roster, progress=progress,
+        )
+        return results, {}
+
+    results, jpeg = await _run_inference(
+        AttendanceOrchestrator.mark_annotated, image, threshold=threshold, tiled=tiled,
+        roster=roster, progress=progress,
+    )
+    return results, {"annotated_image": base64.b64encode(jpeg).decode("ascii")}
+
+
+async def _mark_and_forward(
+    image: bytes,
+    event_id: str,
+    django_token: str,
+    threshold: float,
+    tiled: bool,
+    roster: RosterFilter | None,
+    annotate: bool = False,
+    progress=None,
+) -> dict:
+    """
+    Recognise the students in a photo and mark them present in Django.
+
+    Shared by the sync and async modes of /detect-and-mark; failures surface
+    as HTTPException. progress, if given, is called with each stage name.
+    """
+    results, annotated = await _recognise(image, threshold, tiled, roster, annotate, progress)
+
+    roll_numbers: list[str] = [r["roll"] for r in results]
+
+    if not roll_numbers:
+        return {
+            "success": True,
+            "message": "No students recognised in the photo.",
+            "recognized_count": 0,
+            "roll_numbers": [],
+            "attendance_result": None,
+            **annotated,
+        }
+
+    django_data = await _forward_attendance(event_id, roll_numbers, django_token, progress)
+
+    return {
+        "success": True,
+        "message": "Attendance marked successfully.",
+        "recognized_count": len(roll_numbers),
+        "roll_numbers": roll_numbers,
+        "recognition_details": results,
+        "attendance_result": django_data.get("data", {}),
+        **annotated,
+    }
+
+
+async def _forward_attendance(event_id: str, roll_numbers: list[str], django_token: str, progress=None) -> dict:
+    """Mark roll_numbers present at event_id in Django and return its response body."""
+    # Forward roll numbers to Django over the shared connection pool.
+    if progress is not None:
+        progress("django")
+    started = time.perf_counter()
+    try:
+        response = await _django.mark_attendance(event_id, roll_numbers, django_token)
+    except httpx.RequestError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Could not reach Django backend at {DJANGO_BASE_URL}: {exc}",
+        )
+    finally:
+        _observe_stage("django", time.perf_counter() - started)
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Django attendance endpoint returned {response.status_code}: {response.text}",
+        )
+
+    return response.json()
+
+
+def _decode_embeddings(data: bytes, dtype: str, dim: int) -> np.ndarray:
+    """(N, dim) float32 array from a packed little-endian float32/float16 payload."""
+    if dtype not in EMBEDDING_DTYPES:
+        raise HTTPException(status_code=400, detail=f"dtype must be one of {', '.join(EMBEDDING_DTYPES)}.")
+    itemsize = np.dtype(EMBEDDING_DTYPES[dtype]).itemsize
+    if dim <= 0 or len(data) % (dim * itemsize):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Payload of {len(data)} bytes is not a whole number of {dim}-d {dtype} embeddings.",
+        )
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPES[dtype]).astype(np.float32).reshape(-1, dim)
+
+
+async def _run_detect_and_mark_job(job_id: str, payload: dict) -> dict:
+    """JobQueue handler for /detect-and-mark?mode=async."""
+    def progress(stage: str):
+        _job_store.update(job_id, stage=stage)
+
+    try:
+        return await _mark_and_forward(**payload, progress=progress)
+    except HTTPException as exc:
+        raise JobFailed(str(exc.detail), exc.status_code)
 
 
 # --------------------------------------------------------------------------- #
@@ -76,23 +682,90 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness check for the load balancer, separate from /health.
+
+    Returns 503 until every inference worker has loaded and warmed its models,
+    then 200 with load durations and the gallery size. With EAGER_WARMUP off,
+    the first call starts the warm-up. store_ready is false
+    while a snapshot-loaded gallery is still being reconciled with ChromaDB;
+    matching already works, registrations wait.
+    """
+    if not _readiness["ready"]:
+        _start_warm_up()
+        return JSONResponse(
+            status_code=503,
+            content={"ready": False, "error": _readiness["error"]},
+        )
+
+    system = _orchestrator.system
+    return {
+        "ready": True,
+        "startup_s": _readiness["startup_s"],
+        "load_timings": system.load_timings,
+        "modules": sorted(system.app.models),
+        "inference_workers": INFERENCE_WORKERS,
+        "gallery_size": system.gallery_size(),
+        "store_ready": system.store_ready,
+    }
+
+
+@app.get("/stats")
+def stats():
+    """
+    Runtime counters for tuning throughput against latency.
+
+    Each section is null while its feature is disabled, or before the
+    models have been loaded.
+    """
+    system = _orchestrator.system if _orchestrator is not None else None
+    batcher = system.batcher if system is not None else None
+    cache = system.result_cache if system is not None else None
+    return {
+        "success": True,
+        "recognition_batching": batcher.stats() if batcher is not None else None,
+        "result_cache": cache.stats() if cache is not None else None,
+        "django_client": _django.stats() if _django is not None else None,
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text-format metrics."""
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/register")
 async def register_student(
     roll_no: str = Form(..., description="Student roll number, must match users table"),
     name: str = Form(..., description="Student full name"),
     file: UploadFile = File(..., description="Clear face photo of the student"),
+    branch: str | None = Form(None, description="Student branch, for roster-scoped matching"),
+    year: int | None = Form(None, description="Student year, for roster-scoped matching"),
+    aligned: bool = Form(False, description="The file is an aligned 112x112 face crop; skip detection"),
+    bbox: str | None = Form(None, description="Face box x0,y0,x1,y1 in the file's pixels; skip detection"),
+    landmarks: str | None = Form(None, description="With bbox: eyes, nose tip and mouth corners as 10 comma-separated numbers"),
 ):
     """
     Register a student's face embedding into ChromaDB.
 
     Must be called once per student before attendance can be marked.
     The roll_no must already exist in the Django users table.
+
+    Enrollment kiosks that already located the face can send an aligned crop
+    (aligned=true) or the face box (and landmarks, for the best alignment),
+    so only the recognition model runs.
     """
-    tmp_path = _save_upload_to_tempfile(file)
     try:
-        success = get_orchestrator().register(tmp_path, roll_no, name)
-    finally:
-        os.unlink(tmp_path)
+        options = _face_options(aligned, bbox, landmarks)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    image = await _read_upload(file)
+    success = await _run_inference(
+        AttendanceOrchestrator.register, image, roll_no, name, branch=branch, year=year, **options
+    )
 
     if not success:
         raise HTTPException(status_code=400, detail=f"No face detected in the uploaded image for {roll_no}.")
@@ -103,22 +776,88 @@ async def register_student(
     }
 
 
+@app.post("/register-batch")
+async def register_students_batch(
+    manifest: str = Form(..., description="CSV with filename,roll_no,name[,branch,year,aligned,bbox,landmarks] header, or JSON list of those objects"),
+    archive: UploadFile | None = File(None, description="Zip archive of face photos"),
+    files: list[UploadFile] | None = File(None, description="Face photos, matched to the manifest by filename"),
+):
+    """
+    Register many students in one call.
+
+    Photos come either as one zip archive or as several files; each manifest
+    entry names the photo (by file name) for one roll number. Photos are
+    decoded in parallel, embedded in batches and written to the gallery in
+    one call. Returns a per-student report; students whose photo is
+    missing, unreadable or has no face are reported as failures.
+    """
+    entries = _parse_manifest(manifest)
+
+    if archive is not None:
+        data = await _read_upload(archive, MAX_BATCH_UPLOAD_BYTES)
+        photos = await _pool.run(_read_archive, data, {entry["filename"] for entry in entries})
+    elif files:
+        photos = {}
+        for f in files:
+            name = os.path.basename(f.filename or "")
+            if name in photos:
+                raise HTTPException(status_code=400, detail=f"More than one uploaded file is named {name}.")
+            photos[name] = await _read_upload(f)
+    else:
+        raise HTTPException(status_code=400, detail="Upload either a zip archive or one or more files.")
+
+    missing = [entry for entry in entries if entry["filename"] not in photos]
+    present = [entry for entry in entries if entry["filename"] in photos]
+
+    reports = await _run_inference(
+        AttendanceOrchestrator.register_batch,
+        [
+            (photos[entry["filename"]], entry["roll_no"], entry["name"],
+             {key: entry[key] for key in ("branch", "year", "aligned", "bbox", "kps")})
+            for entry in present
+        ],
+    )
+    reports += [
+        {"roll": entry["roll_no"], "name": entry["name"], "success": False,
+         "error": f"File {entry['filename']} not found in upload"}
+        for entry in missing
+    ]
+
+    # Report back in manifest order.
+    order = {entry["roll_no"]: i for i, entry in enumerate(entries)}
+    reports.sort(key=lambda report: order[report["roll"]])
+    registered = sum(report["success"] for report in reports)
+
+    return {
+        "success": True,
+        "message": f"Registered {registered} of {len(entries)} students.",
+        "registered_count": registered,
+        "failed_count": len(entries) - registered,
+        "results": reports,
+    }
+
+
 @app.post("/detect")
 async def detect_faces(
     file: UploadFile = File(..., description="Group photo or single photo"),
     threshold: float = Form(0.45, description="Similarity threshold (0-1), higher = stricter"),
+    tiled: bool = Form(False, description="Tiled detection for wide shots with many small faces (slower)"),
+    roster: str | None = Form(None, description="Comma-separated roll numbers expected at the event"),
+    branch: str | None = Form(None, description="Only match students of this branch"),
+    year: int | None = Form(None, description="Only match students of this year"),
+    annotate: bool = Form(False, description="Also return the photo annotated with roll labels (base64 JPEG)"),
 ):
     """
     Detect and identify faces in a photo. Returns roll numbers only.
 
     Use this endpoint for testing or when you want to manually send roll numbers
-    to Django yourself.
+    to Django yourself. Pass roster, branch and/or year to only match the
+    students expected at the event.
     """
-    tmp_path = _save_upload_to_tempfile(file)
-    try:
-        results = get_orchestrator().mark(tmp_path, threshold=threshold)
-    finally:
-        os.unlink(tmp_path)
+    image = await _read_upload(file)
+    results, annotated = await _recognise(
+        image, threshold, tiled, _roster_filter(roster, branch, year), annotate,
+    )
 
     roll_numbers = [r["roll"] for r in results]
 
@@ -127,83 +866,212 @@ async def detect_faces(
         "recognized_count": len(roll_numbers),
         "roll_numbers": roll_numbers,
         "details": results,
+        **annotated,
     }
 
 
+@app.post("/detect-video")
+async def detect_video(
+    video: UploadFile | None = File(None, description="Short clip panning across the hall"),
+    frames: list[UploadFile] | None = File(None, description="Burst of still frames, instead of a clip"),
+    threshold: float = Form(0.45, description="Similarity threshold (0-1)"),
+    sample_fps: float = Form(3.0, description="Frames per second sampled from the clip"),
+    max_frames: int = Form(60, description="Most frames processed per request"),
+    roster: str | None = Form(None, description="Comma-separated roll numbers expected at the event"),
+    branch: str | None = Form(None, description="Only match students of this branch"),
+    year: int | None = Form(None, description="Only match students of this year"),
+):
+    """
+    Detect and identify faces across a video clip or burst of frames.
+
+    Faces are tracked across frames so each person is embedded only a few
+    times; returns one deduplicated roll list with the best similarity per
+    student.
+    """
+    roster_filter = _roster_filter(roster, branch, year)
+    if video is not None:
+        clip = await _read_upload(video, MAX_VIDEO_UPLOAD_BYTES)
+        result = await _run_inference(
+            AttendanceOrchestrator.mark_video, clip=clip,
+            threshold=threshold, sample_fps=sample_fps, max_frames=max_frames, roster=roster_filter,
+        )
+    elif frames:
+        images = [await _read_upload(frame) for frame in frames[:max_frames]]
+        result = await _run_inference(
+            AttendanceOrchestrator.mark_video, frames=images,
+            threshold=threshold, max_frames=max_frames, roster=roster_filter,
+        )
+    else:
+        raise HTTPException(status_code=400, detail="Upload either a video clip or one or more frames.")
+
+    attendance = result.pop("attendance")
+    return {
+        "success": True,
+        "recognized_count": len(attendance),
+        "roll_numbers": [r["roll"] for r in attendance],
+        "details": attendance,
+        **result,
+    }
+
+
+@app.post("/match-embeddings")
+async def match_embeddings(
+    file: UploadFile | None = File(None, description="Packed embeddings: N x dim little-endian floats, row-major"),
+    embeddings: str | None = Form(None, description="The same payload base64-encoded, instead of a file (up to 1 MB)"),
+    dtype: str = Form("float32", description="float32 or float16"),
+    dim: int = Form(512, description="Values per embedding"),
+    threshold: float = Form(0.45, description="Similarity threshold (0-1)"),
+    roster: str | None = Form(None, description="Comma-separated roll numbers expected at the event"),
+    branch: str | None = Form(None, description="Only match students of this branch"),
+    year: int | None = Form(None, description="Only match students of this year"),
+    event_id: str | None = Form(None, description="UUID of the event in Django; marks the matches present"),
+    django_token: str | None = Form(None, description="JWT access token, required with event_id"),
+):
+    """
+    Match face embeddings computed on the camera against the gallery.
+
+    For cameras that run detection and ArcFace themselves: only gallery
+    matching (and, with event_id, the Django call) runs here, so the cost
+    per request follows the number of faces rather than the photo size.
+    Embeddings are the recognition model's output for aligned faces, packed
+    as raw float32 or float16 (half the upload).
+    """
+    if file is not None:
+        data = await _read_upload(file)
+    elif embeddings is not None:
+        try:
+            data = base64.b64decode(embeddings, validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail="embeddings is not valid base64.")
+    else:
+        raise HTTPException(status_code=400, detail="Upload the embeddings as a file or base64 form field.")
+    if event_id and not (django_token or "").strip():
+        raise HTTPException(status_code=400, detail="django_token is required with event_id.")
+
+    results = await _run_matching(
+        AttendanceOrchestrator.match_embeddings, _decode_embeddings(data, dtype, dim),
+        threshold=threshold, roster=_roster_filter(roster, branch, year),
+    )
+    roll_numbers = [r["roll"] for r in results]
+    response = {
+        "success": True,
+        "recognized_count": len(roll_numbers),
+        "roll_numbers": roll_numbers,
+        "details": results,
+    }
+    if event_id:
+        response["attendance_result"] = None
+        if roll_numbers:
+            django_data = await _forward_attendance(event_id, roll_numbers, django_token.strip())
+            response["attendance_result"] = django_data.get("data", {})
+    return response
+
+
 @app.post("/detect-and-mark")
 async def detect_and_mark(
     file: UploadFile = File(..., description="Group photo or single photo"),
     event_id: str = Form(..., description="UUID of the event in Django"),
     django_token: str = Form(..., description="JWT access token of an organizer/admin account"),
     threshold: float = Form(0.45, description="Similarity threshold (0-1)"),
+    tiled: bool = Form(False, description="Tiled detection for wide shots with many small faces (slower)"),
+    roster: str | None = Form(None, description="Comma-separated roll numbers expected at the event"),
+    branch: str | None = Form(None, description="Only match students of this branch"),
+    year: int | None = Form(None, description="Only match students of this year"),
+    mode: str = Form("sync", description="sync, or async to get a job id back immediately"),
+    annotate: bool = Form(False, description="Also return the photo annotated with roll labels (base64 JPEG)"),
 ):
     """
     Full pipeline: detect faces → identify roll numbers → call Django to mark attendance.
 
     Steps:
-      1. Save uploaded image to a temp file.
+      1. Read the uploaded image into memory.
       2. Run InsightFace detection + ChromaDB lookup to get roll numbers.
       3. POST the roll numbers to Django's /attendance/mark/ endpoint.
       4. Return the combined result to the caller.
 
     The caller only needs to supply the group photo, event_id, and a valid Django
     organizer/admin JWT token. All other steps are handled internally.
+
+    With mode=async the photo is queued and a 202 with a job id is returned
+    straight away; follow the job at /jobs/{id} or /jobs/{id}/events. The
+    finished job's result is the same body the sync mode returns.
     """
+    if mode not in ("sync", "async"):
+        raise HTTPException(status_code=400, detail="mode must be 'sync' or 'async'.")
+
     # Strip whitespace from token — Postman form-data can introduce invisible
     # newlines or spaces that cause Django to reject the token with 401.
     django_token = django_token.strip()
 
-    # Step 1 + 2: Run face recognition.
-    django_token = django_token.strip()
-    tmp_path = _save_upload_to_tempfile(file)
-    try:
-        results = get_orchestrator().mark(tmp_path, threshold=threshold)
-    finally:
-        os.unlink(tmp_path)
+    image = await _read_upload(file)
+    request = {
+        "image": image,
+        "event_id": event_id,
+        "django_token": django_token,
+        "threshold": threshold,
+        "tiled": tiled,
+        "roster": _roster_filter(roster, branch, year),
+        "annotate": annotate,
+    }
 
-    roll_numbers: list[str] = [r["roll"] for r in results]
+    if mode == "sync":
+        return await _mark_and_forward(**request)
 
-    if not roll_numbers:
-        return {
+    job_id = _jobs.submit("detect-and-mark", request)
+    if job_id is None:
+        raise HTTPException(status_code=503, detail="Too many queued jobs, try again shortly.")
+    return JSONResponse(
+        status_code=202,
+        content={
             "success": True,
-            "message": "No students recognised in the photo.",
-            "recognized_count": 0,
-            "roll_numbers": [],
-            "attendance_result": None,
-        }
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events",
+        },
+    )
 
-    # Step 3: Forward roll numbers to Django.
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{DJANGO_BASE_URL}/attendance/mark/",
-                json={
-                    "event_id": event_id,
-                    "roll_numbers": roll_numbers,
-                },
-                headers={"Authorization": f"Bearer {django_token}"},
-                timeout=30.0,
-            )
-        except httpx.RequestError as exc:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Could not reach Django backend at {DJANGO_BASE_URL}: {exc}",
-            )
 
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Django attendance endpoint returned {response.status_code}: {response.text}",
-        )
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status (queued, running, succeeded, failed), current stage and result of an async job."""
+    job = _job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return {"success": True, **job}
 
-    django_data = response.json()
 
-    # Step 4: Return combined result.
-    return {
-        "success": True,
-        "message": "Attendance marked successfully.",
-        "recognized_count": len(roll_numbers),
-        "roll_numbers": roll_numbers,
-        "recognition_details": results,
-        "attendance_result": django_data.get("data", {}),
-    }
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events for an async job.
+
+    Sends the job (as /jobs/{id} returns it) whenever its status or stage
+    changes, and closes the stream once it has succeeded or failed. A comment
+    line every 15 s keeps idle proxies from dropping the connection.
+    """
+    if _job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+
+    async def stream():
+        last, idle_since = None, time.monotonic()
+        while True:
+            job = _job_store.get(job_id)
+            if job is None:
+                return
+            state = (job["status"], job["stage"])
+            if state != last:
+                last, idle_since = state, time.monotonic()
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                if job["status"] in FINISHED:
+                    return
+            elif time.monotonic() - idle_since > 15:
+                idle_since = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
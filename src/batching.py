@@ -0,0 +1,135 @@
+"""
+Micro-batching scheduler for the ArcFace recognition step.
+
+Concurrent requests each hand their aligned face crops to RecognitionBatcher.
+A single background thread waits a few milliseconds for crops from other
+requests to arrive, runs them through the recognition model as one batch and
+fans the embeddings back out to the callers. Throughput goes up under
+concurrent load at the cost of at most max_wait_ms extra latency per request.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+
+    def __init__(self, crops: list):
+        self.crops = crops
+        self.future: Future = Future()
+
+
+class RecognitionBatcher:
+
+    def __init__(self, embed_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        embed_fn       — takes a list of aligned crops, returns an (N, D) array.
+        max_batch_size — most crops sent to the model in one call.
+        max_wait_ms    — how long the first request of a batch waits for others.
+        """
+        self._embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._crops = 0
+        self._batch_sizes: Counter = Counter()
+
+        self._thread = threading.Thread(target=self._run, name="recognition-batcher", daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------ #
+    #  Public API                                                          #
+    # ------------------------------------------------------------------ #
+
+    def embed(self, crops: list) -> np.ndarray:
+        """Queue one request's crops and block until their embeddings are ready."""
+        request = _Request(crops)
+        self._queue.put(request)
+        return request.future.result()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "requests": self._requests,
+                "crops": self._crops,
+                "batches": batches,
+                "mean_batch_size": round(self._crops / batches, 2) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+            }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    # ------------------------------------------------------------------ #
+    #  Scheduler                                                           #
+    # ------------------------------------------------------------------ #
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = [first]
+            pending = len(first.crops)
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+
+            while pending < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+                pending += len(request.crops)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: list):
+        crops = [crop for request in batch for crop in request.crops]
+        sizes = []
+
+        try:
+            # One request can bring more crops than fit in a batch (a big
+            # group photo), so split into max_batch_size model calls.
+            outputs = []
+            for start in range(0, len(crops), self.max_batch_size):
+                chunk = crops[start:start + self.max_batch_size]
+                outputs.append(np.asarray(self._embed_fn(chunk)))
+                sizes.append(len(chunk))
+            embeddings = np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+        except Exception as exc:
+            for request in batch:
+                request.future.set_exception(exc)
+            return
+
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._crops += len(crops)
+            self._batch_sizes.update(sizes)
+
+        offset = 0
+        for request in batch:
+            count = len(request.crops)
+            request.future.set_result(embeddings[offset:offset + count])
+            offset += count
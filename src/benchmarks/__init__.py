@@ -0,0 +1,7 @@
+"""
+Benchmarks for the face attendance pipeline.
+
+Run from the src/ directory so the service modules are importable, e.g.
+
+    python -m benchmarks.module_selection --photo ../photos/group.png
+"""
@@ -0,0 +1,81 @@
+"""
+Memory, latency and match agreement of compact gallery storage.
+
+Builds a synthetic gallery of random unit vectors (50k identities by default)
+and queries it with noisy copies of gallery members, the way a new photo of a
+registered student lands near their enrolment embedding. Each compact dtype
+is compared with float32 on top-1 agreement and similarity error. Needs only
+NumPy:
+
+    python -m benchmarks.gallery_precision
+    python -m benchmarks.gallery_precision --identities 100000 --faces 100 --json
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from gallery import DTYPES, GalleryIndex
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--faces", type=int, default=60, help="query embeddings per search (faces in a photo)")
+    parser.add_argument("--noise", type=float, default=0.045, help="per-component query noise")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gallery = _unit(rng.standard_normal((args.identities, args.dim)))
+    rolls = [f"R{i:06d}" for i in range(args.identities)]
+
+    truth = rng.choice(args.identities, size=args.faces, replace=False)
+    queries = _unit(gallery[truth] + args.noise * rng.standard_normal((args.faces, args.dim)))
+
+    results, reference = [], None
+    for dtype in DTYPES:
+        index = GalleryIndex(dim=args.dim, capacity=args.identities, dtype=dtype)
+        index.upsert_many(rolls, rolls, gallery)
+
+        latencies = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            similarities, metadatas = index.search(queries, top_k=1)
+            latencies.append(time.perf_counter() - started)
+
+        top1 = [row[0]["roll"] for row in metadatas]
+        if reference is None:
+            reference = (top1, similarities[:, 0])
+
+        results.append({
+            "dtype": dtype,
+            "memory_mb": round(index.nbytes / 2**20, 1),
+            "search_p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "top1_agreement": round(float(np.mean([a == b for a, b in zip(top1, reference[0])])), 4),
+            "top1_correct": round(float(np.mean([roll == rolls[t] for roll, t in zip(top1, truth)])), 4),
+            "max_similarity_error": round(float(np.abs(similarities[:, 0] - reference[1]).max()), 5),
+        })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.identities} identities x {args.dim}-d, {args.faces} faces per search")
+    print(f"{'dtype':<9}{'MB':>8}{'p50 ms':>9}{'agree':>8}{'correct':>9}{'max err':>10}")
+    for r in results:
+        print(f"{r['dtype']:<9}{r['memory_mb']:>8}{r['search_p50_ms']:>9}{r['top1_agreement']:>8}"
+              f"{r['top1_correct']:>9}{r['max_similarity_error']:>10}")
+
+
+if __name__ == "__main__":
+    main()
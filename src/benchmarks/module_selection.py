@@ -0,0 +1,91 @@
+"""
+Startup and per-photo latency for different InsightFace module selections.
+
+Each configuration is measured in a fresh subprocess so model memory from one
+run does not leak into the next:
+
+    python -m benchmarks.module_selection --photo ../photos/group.png
+    python -m benchmarks.module_selection --photo group.jpg --repeats 20 --json
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGS = {
+    "detection+recognition": "detection,recognition",
+    "+landmark_2d_106": "detection,recognition,landmark_2d_106",
+    "all (buffalo_l default)": "all",
+}
+
+
+def _measure(modules: str, photo: str, repeats: int) -> dict:
+    from face_recognition import FaceAttendanceSystem
+
+    with open(photo, "rb") as f:
+        image = f.read()
+
+    with tempfile.TemporaryDirectory() as db_path:
+        started = time.perf_counter()
+        system = FaceAttendanceSystem(
+            modules=None if modules == "all" else tuple(modules.split(",")),
+            db_path=db_path,
+        )
+        startup_s = time.perf_counter() - started
+
+        system.mark_attendance(image)  # first call pays ONNX session warm-up
+        latencies = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            faces, _, _ = system._detect_faces(image)
+            latencies.append(time.perf_counter() - started)
+
+    return {
+        "modules": modules,
+        "startup_s": round(startup_s, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "faces": len(faces),
+        "photo_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "photo_max_ms": round(max(latencies) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo", required=True, help="group photo to run detection on")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print("RESULT " + json.dumps(_measure(args.single, args.photo, args.repeats)))
+        return
+
+    results = []
+    for label, modules in CONFIGS.items():
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.module_selection", "--single", modules,
+             "--photo", args.photo, "--repeats", str(args.repeats)],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("RESULT "))
+        results.append({"config": label, **json.loads(line[len("RESULT "):])})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'config':<26}{'startup s':>10}{'peak RSS MB':>13}{'faces':>7}{'p50 ms':>9}{'max ms':>9}")
+    for r in results:
+        print(f"{r['config']:<26}{r['startup_s']:>10}{r['peak_rss_mb']:>13}{r['faces']:>7}"
+              f"{r['photo_p50_ms']:>9}{r['photo_max_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Per-stage latency and throughput of FaceAttendanceSystem.
+
+Runs synthetic group photos (1, 20 and 100 faces by default) against
+synthetic galleries (100, 10k and 100k identities) and reports p50/p95 per
+stage — decode, detect, embed, match — taken from the system's
+stage_observer, plus Django forwarding measured with DjangoClient against a
+local stub server. Uses the stand-in models from benchmarks.standin unless
+--insightface is given, and an in-memory ChromaDB, so it runs anywhere:
+
+    python -m benchmarks.pipeline_stages
+    python -m benchmarks.pipeline_stages --faces 20 --identities 10000 --backend chroma
+    python -m benchmarks.pipeline_stages --output results/stages-$(git rev-parse --short HEAD).json
+
+Every face in the benchmark photos is registered and the remaining
+identities are random unit vectors, so each face has a true match to find.
+--output writes the results (with run metadata) as JSON for comparing runs.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from benchmarks.standin import StandInModel, render_group_photo
+from django_client import DjangoClient
+from face_recognition import FaceAttendanceSystem
+
+STAGES = ("decode", "detect", "embed", "match", "total", "django")
+
+
+class _StubDjango(BaseHTTPRequestHandler):
+    """Answers /attendance/mark/ like Django, without doing any work."""
+
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment; otherwise Nagle plus delayed ACKs
+    # add ~40 ms to every keep-alive request and swamp the client's own cost.
+    disable_nagle_algorithm = True
+    wbufsize = 1 << 16
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"success": true, "data": {}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _summarise(samples: list[float]) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "samples": len(samples),
+    }
+
+
+def _build_gallery(system: FaceAttendanceSystem, photos: dict, identities: int, seed: int = 0):
+    """Register every face in photos, then pad with random identities."""
+    rolls, embeddings = [], []
+    for faces, jpeg in photos.items():
+        detection, _ = system._detect_cached(jpeg, tiled=False)
+        rolls += [f"P{faces:03d}-{i:03d}" for i in range(len(detection.embeddings))]
+        embeddings.append(detection.embeddings)
+    embeddings = np.concatenate(embeddings)[:identities]
+    rolls = rolls[:identities]
+
+    filler = np.random.default_rng(seed).standard_normal((identities - len(rolls), embeddings.shape[1]))
+    filler = (filler / np.linalg.norm(filler, axis=1, keepdims=True)).astype(np.float32)
+    embeddings = np.concatenate([embeddings, filler])
+    rolls += [f"R{i:06d}" for i in range(len(filler))]
+
+    # ChromaDB caps the records per upsert call.
+    for start in range(0, identities, 5000):
+        stop = start + 5000
+        system._upsert_students(rolls[start:stop], rolls[start:stop], embeddings[start:stop])
+
+
+def _bench_photos(system: FaceAttendanceSystem, photos: dict, identities: int, repeats: int) -> list:
+    timings = defaultdict(list)
+    system.stage_observer = lambda stage, seconds: timings[stage].append(seconds)
+
+    results = []
+    for faces, jpeg in photos.items():
+        if faces > identities:
+            continue
+        timings.clear()
+        system.mark_attendance(jpeg)  # warm-up, not recorded
+        timings.clear()
+
+        recognised = 0
+        for _ in range(repeats):
+            started = time.perf_counter()
+            recognised = len(system.mark_attendance(jpeg))
+            timings["total"].append(time.perf_counter() - started)
+
+        total_s = sum(timings["total"])
+        results.append({
+            "faces": faces,
+            "identities": identities,
+            "recognised": recognised,
+            "stages": {stage: _summarise(timings[stage]) for stage in STAGES if timings[stage]},
+            "photos_per_s": round(repeats / total_s, 2),
+            "faces_per_s": round(repeats * faces / total_s, 1),
+        })
+
+    system.stage_observer = None
+    return results
+
+
+async def _bench_django(faces_list: list, repeats: int) -> dict:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubDjango)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = DjangoClient(f"http://127.0.0.1:{server.server_port}")
+    try:
+        results = {}
+        for faces in faces_list:
+            rolls = [f"R{i:06d}" for i in range(faces)]
+            await client.mark_attendance("bench", rolls, "token")  # opens the connection
+            samples = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                await client.mark_attendance("bench", rolls, "token")
+                samples.append(time.perf_counter() - started)
+            results[faces] = _summarise(samples)
+        results["client"] = client.stats()
+        return results
+    finally:
+        await client.aclose()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--identities", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--backend", choices=("memory", "chroma"), default="memory")
+    parser.add_argument("--gallery-dtype", default="float32")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--insightface", action="store_true", help="use the real buffalo_l models")
+    parser.add_argument("--no-django", action="store_true", help="skip the Django forwarding stage")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    photos = {
+        faces: cv2.imencode(".jpg", render_group_photo(faces), [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+        for faces in args.faces
+    }
+
+    django = asyncio.run(_bench_django(args.faces, args.repeats)) if not args.no_django else {}
+
+    results = []
+    for identities in args.identities:
+        system = FaceAttendanceSystem(
+            db_path=None,
+            collection_name=f"bench_{identities}",
+            gallery_backend=args.backend,
+            gallery_dtype=args.gallery_dtype,
+            model_factory=None if args.insightface else StandInModel,
+        )
+        system.warm_up()
+        _build_gallery(system, photos, identities)
+        for row in _bench_photos(system, photos, identities, args.repeats):
+            if row["faces"] in django:
+                row["stages"]["django"] = django[row["faces"]]
+            results.append(row)
+        system.close()
+
+    report = {
+        "benchmark": "pipeline_stages",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "models": "insightface" if args.insightface else "stand-in",
+        "backend": args.backend,
+        "gallery_dtype": args.gallery_dtype,
+        "repeats": args.repeats,
+        "django_client": django.get("client"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['models']} models, {args.backend} gallery ({args.gallery_dtype}), {args.repeats} repeats")
+    print(f"{'faces':>6}{'ids':>8}" + "".join(f"{stage + ' p50/p95':>20}" for stage in STAGES) + f"{'photo/s':>9}")
+    for r in results:
+        cells = "".join(
+            f"{r['stages'][s]['p50_ms']:>10.2f}/{r['stages'][s]['p95_ms']:<9.2f}" if s in r["stages"] else f"{'-':>20}"
+            for s in STAGES
+        )
+        print(f"{r['faces']:>6}{r['identities']:>8}{cells}{r['photos_per_s']:>9}")
+
+
+if __name__ == "__main__":
+    main()
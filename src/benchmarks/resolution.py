@@ -0,0 +1,103 @@
+"""
+Latency and detection recall versus input resolution.
+
+Resamples one group photo to several megapixel sizes, JPEG-encodes each, and
+runs decode + detection + embedding twice: with the resolution-adaptive
+pipeline (reduced JPEG decode, detection on a det_size copy) and with the
+full-resolution baseline. Recall is measured against the baseline's faces at
+the same resolution, matched by box IoU:
+
+    python -m benchmarks.resolution --photo ../photos/group.png
+    python -m benchmarks.resolution --photo group.jpg --megapixels 2 12 48 --json
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from face_recognition import FaceAttendanceSystem
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _recall(reference: list, found: list, ref_scale: float, iou: float = 0.5) -> float:
+    if not reference:
+        return 1.0
+    hits = sum(
+        any(_iou(ref.bbox * ref_scale, face.bbox) >= iou for face in found)
+        for ref in reference
+    )
+    return hits / len(reference)
+
+
+def _time_pipeline(system: FaceAttendanceSystem, jpeg: bytes, repeats: int):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        faces, img, _ = system._detect_faces(jpeg)
+        latencies.append(time.perf_counter() - started)
+    return faces, img, statistics.median(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo", required=True)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[2, 12, 24, 48])
+    parser.add_argument("--max-image-side", type=int, default=4096)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    source = cv2.imread(args.photo)
+    if source is None:
+        raise SystemExit(f"Could not load {args.photo}")
+
+    with tempfile.TemporaryDirectory() as db_path:
+        system = FaceAttendanceSystem(db_path=db_path)
+        system.warm_up()
+
+        results = []
+        for mp in args.megapixels:
+            scale = (mp * 1e6 / (source.shape[0] * source.shape[1])) ** 0.5
+            resized = cv2.resize(source, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            jpeg = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+
+            system.max_image_side, system.adaptive_detection = 0, False
+            base_faces, base_img, base_s = _time_pipeline(system, jpeg, args.repeats)
+
+            system.max_image_side, system.adaptive_detection = args.max_image_side, True
+            faces, img, adaptive_s = _time_pipeline(system, jpeg, args.repeats)
+
+            results.append({
+                "megapixels": mp,
+                "size": f"{resized.shape[1]}x{resized.shape[0]}",
+                "baseline_ms": round(base_s * 1000, 1),
+                "adaptive_ms": round(adaptive_s * 1000, 1),
+                "baseline_faces": len(base_faces),
+                "adaptive_faces": len(faces),
+                "recall_vs_baseline": round(_recall(base_faces, faces, img.shape[1] / base_img.shape[1]), 3),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'MP':>5}{'size':>12}{'baseline ms':>13}{'adaptive ms':>13}{'faces':>11}{'recall':>8}")
+    for r in results:
+        print(f"{r['megapixels']:>5}{r['size']:>12}{r['baseline_ms']:>13}{r['adaptive_ms']:>13}"
+              f"{r['baseline_faces']:>5}/{r['adaptive_faces']:<5}{r['recall_vs_baseline']:>8}")
+
+
+if __name__ == "__main__":
+    main()
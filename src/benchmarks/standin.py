@@ -0,0 +1,98 @@
+"""
+Synthetic photos and lightweight stand-ins for the InsightFace models.
+
+Lets the pipeline benchmarks run on any CPU box without downloading or
+running the ONNX models. Faces are drawn as bright patches of coloured cells
+on a dark background, one colour pattern per identity:
+
+  StandInDetector   — finds the patches with connected components; returns
+                      boxes and five keypoints like SCRFD's detect().
+  StandInRecognizer — projects a downsampled aligned crop to 512 dimensions
+                      with a fixed random matrix, so the same face always
+                      gets the same embedding.
+
+The absolute timings are not InsightFace's; what they measure is the
+pipeline's own overhead around the models (decode, alignment, batching,
+gallery search) and how it scales with faces and gallery size.
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+# Keypoints (eyes, nose, mouth corners) as fractions of the face box.
+_KPS_LAYOUT = np.array(
+    [[0.3, 0.4], [0.7, 0.4], [0.5, 0.55], [0.35, 0.75], [0.65, 0.75]],
+    dtype=np.float32,
+)
+
+
+class StandInDetector:
+    input_size = (640, 640)
+
+    def __init__(self, min_area: int = 16):
+        self.min_area = min_area
+
+    def detect(self, img, max_num=0, metric="default", input_size=None):
+        mask = (img.max(axis=2) > 60).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+
+        boxes = []
+        for x, y, w, h, area in stats[1:count]:
+            if area >= self.min_area:
+                boxes.append([x, y, x + w, y + h, 0.99])
+        bboxes = np.array(boxes, dtype=np.float32).reshape(-1, 5)
+
+        sizes = bboxes[:, 2:4] - bboxes[:, 0:2]
+        kpss = bboxes[:, None, 0:2] + _KPS_LAYOUT[None] * sizes[:, None]
+        return bboxes, kpss.astype(np.float32)
+
+
+class StandInRecognizer:
+    input_size = (112, 112)
+
+    def __init__(self, dim: int = 512, seed: int = 0):
+        self._projection = np.random.default_rng(seed).standard_normal((8 * 8 * 3, dim)).astype(np.float32)
+
+    def get_feat(self, crops):
+        small = np.stack([
+            cv2.resize(crop, (8, 8), interpolation=cv2.INTER_AREA).reshape(-1) for crop in crops
+        ]).astype(np.float32)
+        small -= small.mean(axis=1, keepdims=True)
+        return small @ self._projection
+
+
+class StandInModel:
+    """Quacks like a prepared insightface FaceAnalysis with detection + recognition."""
+
+    def __init__(self):
+        self.det_model = StandInDetector()
+        self.models = {"detection": self.det_model, "recognition": StandInRecognizer()}
+
+    def prepare(self, ctx_id=-1, det_size=(640, 640), det_thresh=0.5):
+        pass
+
+
+def render_group_photo(faces: int, width: int = 1920, height: int = 1280, seed: int = 0) -> np.ndarray:
+    """
+    A BGR photo of `faces` distinct synthetic faces laid out on a grid.
+
+    Face i always gets the same pattern for the same seed, so it embeds the
+    same way in every photo.
+    """
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 40, size=(height, width, 3), dtype=np.uint8)
+
+    cols = math.ceil(math.sqrt(faces * width / height))
+    rows = math.ceil(faces / cols)
+    cell = min(width // cols, height // rows)
+    size = min(int(cell * 0.6), 240) // 4 * 4
+
+    for i in range(faces):
+        r, c = divmod(i, cols)
+        y = r * cell + (cell - size) // 2
+        x = c * cell + (cell - size) // 2
+        pattern = np.random.default_rng((seed, i)).integers(80, 256, size=(4, 4, 3), dtype=np.uint8)
+        img[y:y + size, x:x + size] = cv2.resize(pattern, (size, size), interpolation=cv2.INTER_NEAREST)
+    return img
@@ -0,0 +1,107 @@
+"""
+Photo latency of tiled detection for TILE_WORKERS x ORT_THREADS.
+
+Tiled detection runs one detector pass per tile on TILE_WORKERS threads, all
+sharing one ONNX Runtime session whose intra-op pool already has ORT_THREADS
+threads (0 = one per core). Their product is the number of busy threads, and
+going past the core count makes every pass slower instead of the photo
+faster. This times a photo's worth of detector passes (tiles + 1 whole-image
+pass) for each combination.
+
+Pass --model with the detector of the model pack (e.g.
+~/.insightface/models/buffalo_l/det_10g.onnx) to measure the real thing;
+without it a stand-in convolution stack of similar cost (~6 GFLOPs at
+640x640) is generated. Needs onnxruntime (and onnx for the stand-in):
+
+    python -m benchmarks.tile_threads
+    python -m benchmarks.tile_threads --model det_10g.onnx --workers 1 2 4 --ort-threads 0 1 2
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import onnxruntime
+
+
+def _standin_model() -> bytes:
+    """Strided 3x3 convolutions with ReLU, shaped like a small detector backbone."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    layers = [(3, 32, 2), (32, 64, 2), (64, 64, 1), (64, 128, 2), (128, 128, 1), (128, 128, 2)]
+    nodes, weights, name = [], [], "input"
+    for i, (cin, cout, stride) in enumerate(layers):
+        weight = numpy_helper.from_array((rng.standard_normal((cout, cin, 3, 3)) * 0.05).astype(np.float32), f"w{i}")
+        weights.append(weight)
+        nodes.append(helper.make_node("Conv", [name, f"w{i}"], [f"c{i}"], pads=[1, 1, 1, 1], strides=[stride, stride]))
+        nodes.append(helper.make_node("Relu", [f"c{i}"], [f"r{i}"]))
+        name = f"r{i}"
+    graph = helper.make_graph(
+        nodes, "standin_detector",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, [1, 3, None, None])],
+        [helper.make_tensor_value_info(name, TensorProto.FLOAT, None)],
+        weights,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    return model.SerializeToString()
+
+
+def _session(model, ort_threads: int) -> onnxruntime.InferenceSession:
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = ort_threads
+    options.inter_op_num_threads = 1
+    return onnxruntime.InferenceSession(model, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="detector .onnx file; default: generated stand-in")
+    parser.add_argument("--passes", type=int, default=7, help="detector passes per photo (tiles + 1)")
+    parser.add_argument("--size", type=int, default=640, help="detector input side (det_size)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--ort-threads", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    model = args.model or _standin_model()
+    tile = np.random.default_rng(0).standard_normal((1, 3, args.size, args.size)).astype(np.float32)
+
+    results = []
+    for ort_threads in args.ort_threads:
+        session = _session(model, ort_threads)
+        feed = {session.get_inputs()[0].name: tile}
+        session.run(None, feed)
+        for workers in args.workers:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                latencies = []
+                for _ in range(args.repeats):
+                    started = time.perf_counter()
+                    list(pool.map(lambda _: session.run(None, feed), range(args.passes)))
+                    latencies.append(time.perf_counter() - started)
+            results.append({
+                "tile_workers": workers,
+                "ort_threads": ort_threads,
+                "photo_p50_ms": round(statistics.median(latencies) * 1000, 1),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.model or 'stand-in detector'}, {args.passes} passes of {args.size}x{args.size}, "
+          f"{os.cpu_count()} cores (ORT_THREADS=0 means one per core)")
+    print(f"{'TILE_WORKERS':>13}{'ORT_THREADS':>13}{'photo p50 ms':>14}")
+    for r in results:
+        print(f"{r['tile_workers']:>13}{r['ort_threads']:>13}{r['photo_p50_ms']:>14}")
+
+
+if __name__ == "__main__":
+    main()
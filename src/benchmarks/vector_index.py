@@ -0,0 +1,152 @@
+"""
+Recall against latency for the gallery backends (see gallery.VectorIndex).
+
+Builds one gallery (100k identities by default) and queries it with noisy
+copies of gallery members, as in gallery_precision. Exact float32 search is
+the reference. The int8 exact index (a quarter of the memory) and IVFPQIndex,
+swept over nprobe, are reported as recall@1 (how often the best match is the
+exact best match), search latency per photo, memory and the similarity error
+on agreeing matches. ChromaDB's HNSW index
+is included with --chroma.
+
+Random unit vectors have no cluster structure for the coarse quantiser to
+exploit. --clusters draws identities around that many centres instead (many
+small clusters are the hardest case measured: their cells are crowded with
+near neighbours), and --embeddings runs on real embeddings, e.g. the
+embeddings.npy of a gallery snapshot (see snapshot.py):
+
+    python -m benchmarks.vector_index
+    python -m benchmarks.vector_index --identities 200000 --nprobe 8 32 128 --clusters 2000
+    python -m benchmarks.vector_index --embeddings ./gallery_snapshot/embeddings.npy --json
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import numpy as np
+
+from gallery import ChromaIndex, GalleryIndex
+from ivfpq import IVFPQIndex
+
+
+def _unit(rows: np.ndarray) -> np.ndarray:
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _gallery(args, rng: np.random.Generator) -> np.ndarray:
+    if args.embeddings:
+        return _unit(np.load(args.embeddings).astype(np.float32))
+    if args.clusters:
+        centres = _unit(rng.standard_normal((args.clusters, args.dim)))
+        members = centres[rng.integers(args.clusters, size=args.identities)]
+        return _unit(members + args.spread * rng.standard_normal((args.identities, args.dim)))
+    return _unit(rng.standard_normal((args.identities, args.dim)))
+
+
+def _time_search(index, queries: np.ndarray, repeats: int, **kwargs):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        similarities, metadatas = index.search(queries, top_k=1, **kwargs)
+        latencies.append(time.perf_counter() - started)
+    top1 = [row[0]["roll"] if row and row[0] is not None else None for row in metadatas]
+    return statistics.median(latencies), top1, similarities[:, 0]
+
+
+def _row(name: str, p50: float, top1: list, similarities: np.ndarray, reference: tuple, truth: list, **extra) -> dict:
+    # Similarity error only where both found the same student.
+    agree = np.array([a == b for a, b in zip(top1, reference[0])])
+    error = np.abs(similarities[agree] - reference[1][agree]).max() if agree.any() else float("nan")
+    return {
+        "index": name,
+        **extra,
+        "search_p50_ms": round(p50 * 1000, 2),
+        "recall_at_1": round(float(agree.mean()), 4),
+        "top1_correct": round(float(np.mean([a == b for a, b in zip(top1, truth)])), 4),
+        "max_similarity_error": round(float(error), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--embeddings", help="(N, D) .npy file of real embeddings to use as the gallery")
+    parser.add_argument("--clusters", type=int, default=0, help="draw identities around this many centres")
+    parser.add_argument("--spread", type=float, default=0.05, help="per-component spread around a centre")
+    parser.add_argument("--faces", type=int, default=60, help="query embeddings per search (faces in a photo)")
+    parser.add_argument("--noise", type=float, default=0.045, help="per-component query noise")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--m", type=int, default=16, help="PQ bytes per vector")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64, 128])
+    parser.add_argument("--rerank", type=int, default=32)
+    parser.add_argument("--refine", choices=["int8", "float16", "float32"], default="int8",
+                        help="dtype of the IVF-PQ copy the shortlist is re-scored against")
+    parser.add_argument("--chroma", action="store_true", help="also measure ChromaDB's HNSW index")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    gallery = _gallery(args, rng)
+    identities, dim = gallery.shape
+    rolls = [f"R{i:06d}" for i in range(identities)]
+
+    sample = rng.choice(identities, size=args.faces, replace=False)
+    truth = [rolls[i] for i in sample]
+    queries = _unit(gallery[sample] + args.noise * rng.standard_normal((args.faces, dim)))
+
+    exact = GalleryIndex(dim=dim, capacity=identities)
+    exact.upsert_many(rolls, rolls, gallery)
+    p50, top1, similarities = _time_search(exact, queries, args.repeats)
+    reference = (top1, similarities)
+    results = [_row("exact", p50, top1, similarities, reference, truth,
+                    memory_mb=round(exact.nbytes / 2**20, 1))]
+
+    exact_int8 = GalleryIndex(dim=dim, capacity=identities, dtype="int8")
+    exact_int8.upsert_many(rolls, rolls, gallery)
+    p50, top1, similarities = _time_search(exact_int8, queries, args.repeats)
+    results.append(_row("int8", p50, top1, similarities, reference, truth,
+                        memory_mb=round(exact_int8.nbytes / 2**20, 1)))
+
+    started = time.perf_counter()
+    ivf = IVFPQIndex(dim=dim, nlist=args.nlist, m=args.m, train_size=identities + 1, rerank=args.rerank,
+                     refine_dtype=args.refine)
+    ivf.upsert_many(rolls, rolls, gallery)
+    ivf.train()
+    build_s = round(time.perf_counter() - started, 1)
+    for nprobe in args.nprobe:
+        p50, top1, similarities = _time_search(ivf, queries, args.repeats, nprobe=nprobe)
+        results.append(_row("ivfpq", p50, top1, similarities, reference, truth, nprobe=nprobe,
+                            memory_mb=round(ivf.nbytes / 2**20, 1), build_s=build_s))
+
+    if args.chroma:
+        import chromadb
+
+        started = time.perf_counter()
+        collection = chromadb.EphemeralClient().get_or_create_collection(
+            name="bench_vector_index", metadata={"hnsw:space": "cosine"}
+        )
+        chroma = ChromaIndex(collection)
+        chroma.upsert_many(rolls, rolls, gallery)
+        build_s = round(time.perf_counter() - started, 1)
+        p50, top1, similarities = _time_search(chroma, queries, args.repeats)
+        results.append(_row("chroma", p50, top1, similarities, reference, truth, build_s=build_s))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    source = args.embeddings or (f"{args.clusters} clusters" if args.clusters else "random unit vectors")
+    print(f"{identities} identities x {dim}-d ({source}), {args.faces} faces per search, "
+          f"IVF-PQ nlist={ivf.nlist} m={args.m} refine={args.refine}")
+    print(f"{'index':<8}{'nprobe':>7}{'MB':>8}{'p50 ms':>9}{'recall@1':>10}{'correct':>9}{'max err':>10}")
+    for r in results:
+        print(f"{r['index']:<8}{r.get('nprobe', '-'):>7}{r.get('memory_mb', '-'):>8}{r['search_p50_ms']:>9}"
+              f"{r['recall_at_1']:>10}{r['top1_correct']:>9}{r['max_similarity_error']:>10}")
+
+
+if __name__ == "__main__":
+    main()
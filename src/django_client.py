@@ -0,0 +1,132 @@
+"""
+Long-lived HTTP client for calls from the face service to Django.
+
+One httpx.AsyncClient is opened with the app and shared by every request, so
+marking attendance reuses pooled keep-alive connections instead of paying a
+TCP (and TLS) handshake per photo. HTTP/2 needs the h2 package (httpx's
+http2 extra), which requiremenets.txt pins; without it the client falls
+back to HTTP/1.1 and /stats reports http2: false.
+
+Django's /attendance/mark/ uses get_or_create per student, so re-sending the
+same roll list is harmless; connect errors and 502/503/504 responses are
+retried with exponential backoff.
+"""
+
+import asyncio
+import random
+import threading
+
+import httpx
+
+try:
+    import h2  # noqa: F401 — only needed for httpx's HTTP/2 support
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+class DjangoClient:
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry_s: float = 30.0,
+        connect_timeout_s: float = 5.0,
+        read_timeout_s: float = 30.0,
+        retries: int = 2,
+        backoff_s: float = 0.5,
+    ):
+        """
+        max_connections / max_keepalive — pool limits toward Django.
+        retries   — extra attempts after a connect error or 502/503/504.
+        backoff_s — delay before the first retry, doubled (with jitter) each time.
+        """
+        self.base_url = base_url.rstrip("/")
+        if not HTTP2_AVAILABLE:
+            print("[WARN] h2 is not installed; Django calls use HTTP/1.1 (pip install 'httpx[http2]')")
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry_s,
+            ),
+            timeout=httpx.Timeout(read_timeout_s, connect=connect_timeout_s),
+        )
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._new_connections = 0
+        self._retries = 0
+        self._failures = 0
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _trace(self, event: str, info: dict):
+        # httpcore emits connect_tcp only when it has to open a new connection;
+        # a request served from the pool goes straight to sending headers.
+        if event == "connection.connect_tcp.started":
+            with self._lock:
+                self._new_connections += 1
+
+    async def post(self, path: str, json: dict, token: str) -> httpx.Response:
+        """
+        POST json to Django, retrying transient failures.
+
+        Raises httpx.RequestError if Django is still unreachable after the
+        last attempt; any final HTTP response is returned to the caller.
+        """
+        attempt = 0
+        while True:
+            with self._lock:
+                self._requests += 1
+            try:
+                response = await self._client.post(
+                    path,
+                    json=json,
+                    headers={"Authorization": f"Bearer {token}"},
+                    extensions={"trace": self._trace},
+                )
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                print(f"[WARN] Django returned {response.status_code}, retrying")
+            except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                if attempt >= self.retries:
+                    with self._lock:
+                        self._failures += 1
+                    raise
+                print(f"[WARN] Could not reach Django ({exc}), retrying")
+
+            with self._lock:
+                self._retries += 1
+            await asyncio.sleep(self.backoff_s * (2 ** attempt) * random.uniform(0.5, 1.0))
+            attempt += 1
+
+    async def mark_attendance(self, event_id: str, roll_numbers: list[str], token: str) -> httpx.Response:
+        return await self.post(
+            "/attendance/mark/",
+            json={"event_id": event_id, "roll_numbers": roll_numbers},
+            token=token,
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            reused = max(self._requests - self._new_connections, 0)
+            return {
+                "base_url": self.base_url,
+                "http2": HTTP2_AVAILABLE,
+                "requests": self._requests,
+                "new_connections": self._new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self._requests, 3) if self._requests else 0.0,
+                "retries": self._retries,
+                "failures": self._failures,
+            }
@@ -1,7 +1,182 @@
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import numpy as np
 import cv2
 import chromadb
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+
+from batching import RecognitionBatcher
+from gallery import ChromaIndex, GalleryIndex, RosterFilter, VectorIndex
+from ivfpq import IVFPQIndex
+from quality import QualityGate
+from snapshot import load_snapshot, reconcile, write_snapshot
+from result_cache import CachedDetection, DetectionCache
+from video import IoUTracker
+
+
+# InsightFace modules attendance actually needs. buffalo_l also ships
+# gender/age and 2D/3D landmark models; loading them costs memory, startup
+# time and per-face inference for outputs we never read.
+DEFAULT_MODULES = ("detection", "recognition")
+
+# Anything the pipeline can read a photo from: a file path, the encoded bytes
+# of an upload (JPEG/PNG/...), or an already-decoded BGR array as cv2 returns.
+ImageSource = str | bytes | bytearray | memoryview | np.ndarray
+
+# cv2 flags that let libjpeg decode straight to 1/2, 1/4 or 1/8 resolution.
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+class PhotoResult:
+    """What one analyze_photo pass found in a photo, enough to render it later."""
+
+    def __init__(self, attendance: list, unrecognized: int, detection: CachedDetection,
+                 matches: list, image: np.ndarray | None = None):
+        self.attendance = attendance
+        self.unrecognized = unrecognized
+        self.bboxes = detection.bboxes
+        self.det_scores = detection.det_scores
+        # {reason: count} of faces the quality gate kept from recognition;
+        # they have no box here.
+        self.skipped = detection.skipped
+        # Per detected face: its attendance record, or None if unrecognised.
+        self.matches = matches
+        self.image = image
+
+
+def _roster_metadata(branch: str | None = None, year: int | None = None) -> dict:
+    """Branch / year metadata stored with a student, omitting unknown values."""
+    meta = {}
+    if branch:
+        meta["branch"] = branch
+    if year is not None:
+        meta["year"] = int(year)
+    return meta
+
+
+# Where the five alignment landmarks (eyes, nose tip, mouth corners) sit in a
+# detector face box on average, as fractions of its width and height. Used to
+# align a face that comes with a box but no landmarks.
+_BOX_LANDMARKS = np.array(
+    [[0.27, 0.38], [0.73, 0.38], [0.50, 0.57], [0.31, 0.79], [0.69, 0.79]], dtype=np.float32
+)
+
+
+def _limit_ort_threads(model, threads: int):
+    """
+    Recreate every ONNX Runtime session of a FaceAnalysis with a fixed
+    intra-op thread count (insightface does not expose session options).
+
+    With threads=1 ORT starts no thread pool, which is what makes it safe to
+    fork worker processes after the models are loaded.
+    """
+    import onnxruntime
+
+    for task, task_model in model.models.items():
+        session = getattr(task_model, "session", None)
+        if session is None:
+            continue
+        # insightface's model_zoo classes keep the .onnx path they loaded.
+        model_file = getattr(task_model, "model_file", None)
+        if not model_file:
+            # Leaving the session as it is could hang forked workers.
+            raise RuntimeError(f"Cannot limit ORT threads for {task}: the model records no model_file")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        task_model.session = onnxruntime.InferenceSession(
+            model_file,
+            sess_options=options,
+            providers=session.get_providers(),
+        )
+
+
+def _tile_starts(length: int, tile: int, overlap: float) -> list:
+    """Start offsets of tiles covering [0, length) with the given overlap fraction."""
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+def _inside_tile(bboxes: np.ndarray, region: tuple, shape: tuple, margin: float = 2.0) -> np.ndarray:
+    """
+    Mask of tile detections (in image coordinates) that stay clear of the
+    tile's interior edges.
+
+    A face cut by a tile edge comes back as a partial box. Its IoU with the
+    full box from a neighbouring tile is low, so NMS would keep both. Edges
+    on the image border do not count: nothing lies beyond them.
+    """
+    x0, y0, x1, y1 = region
+    h, w = shape[:2]
+    keep = np.ones(len(bboxes), dtype=bool)
+    if x0 > 0:
+        keep &= bboxes[:, 0] > x0 + margin
+    if y0 > 0:
+        keep &= bboxes[:, 1] > y0 + margin
+    if x1 < w:
+        keep &= bboxes[:, 2] < x1 - margin
+    if y1 < h:
+        keep &= bboxes[:, 3] < y1 - margin
+    return keep
+
+
+def _nms(bboxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indices of boxes (x1, y1, x2, y2, score rows) kept by greedy non-max suppression."""
+    x1, y1, x2, y2, scores = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3], bboxes[:, 4]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def _jpeg_size(data) -> tuple | None:
+    """Read (width, height) from a JPEG's SOF header without decoding it."""
+    buf = memoryview(data)
+    if len(buf) < 4 or buf[0] != 0xFF or buf[1] != 0xD8:
+        return None
+
+    pos = 2
+    while pos + 9 < len(buf):
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        length = (buf[pos + 2] << 8) | buf[pos + 3]
+        # SOF0..SOF15 carry the frame size; C4/C8/CC are DHT/JPG/DAC, not frames.
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (buf[pos + 5] << 8) | buf[pos + 6]
+            width = (buf[pos + 7] << 8) | buf[pos + 8]
+            return width, height
+        pos += 2 + length
+    return None
 
 
 class FaceAttendanceSystem:
@@ -9,121 +184,995 @@ class FaceAttendanceSystem:
     def __init__(
         self,
         model_name: str = "buffalo_l",
+        modules: tuple = DEFAULT_MODULES,
         det_size: tuple = (640, 640),
         ctx_id: int = -1,
-        db_path: str = "./attendance_db",
+        db_path: str | None = "./attendance_db",
         collection_name: str = "students",
+        gallery_backend: str = "memory",
+        gallery_dtype: str = "float32",
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 0.0,
+        max_image_side: int = 4096,
+        adaptive_detection: bool = True,
+        tile_size: int = 1024,
+        tile_overlap: float = 0.2,
+        tile_nms_iou: float = 0.4,
+        tile_workers: int = 1,
+        cache_max_bytes: int = 0,
+        cache_ttl_s: float = 600.0,
+        ort_threads: int = 0,
+        snapshot_path: str | None = None,
+        ivf_nlist: int = 1024,
+        ivf_nprobe: int = 64,
+        pq_m: int = 16,
+        ivf_refine: str = "int8",
+        quality_gate: QualityGate | None = None,
+        model_factory=None,
+        stage_observer=None,
+        photo_observer=None,
     ):
+        """
+        db_path        — ChromaDB directory; None keeps the collection in memory only.
+        ort_threads    — ONNX Runtime intra-op threads per model session
+                         (0 = ORT default, one per core). serve.py uses 1 so
+                         models can be loaded before forking workers.
+        snapshot_path  — directory of a gallery snapshot (see snapshot.py).
+                         With the memory backend the gallery is mapped from
+                         it at startup and ChromaDB is opened and reconciled
+                         in the background; the snapshot is rewritten when
+                         it was missing or stale, and on close().
+        ivf_nlist, ivf_nprobe, pq_m, ivf_refine
+                       — IVFPQIndex cells, cells probed per face, PQ bytes
+                         per student and dtype of the copy its shortlist is
+                         re-scored against ("int8", "float16" or "float32")
+                         for gallery_backend="ivfpq".
+        quality_gate   — optional QualityGate; faces it rejects in a photo
+                         are never embedded or matched (see quality.py).
+        model_factory  — optional callable returning a FaceAnalysis-like model,
+                         used instead of loading model_name (e.g. the
+                         benchmarks' stand-in models).
+        stage_observer — optional callable(stage, seconds), told how long each
+                         photo spent in decode, detect, embed and match.
+        photo_observer — optional callable(faces, recognized, unrecognized,
+                         skipped), called once per photo analysed; skipped
+                         is the quality gate's {reason: count}.
+        """
+        if gallery_backend not in ("memory", "chroma", "ivfpq"):
+            raise ValueError(f"Unknown gallery backend: {gallery_backend!r}")
+        if modules is not None and not {"detection", "recognition"} <= set(modules):
+            raise ValueError(f"modules must include detection and recognition, got {modules!r}")
+
+        self.model_name = model_name
+        self.modules = list(modules) if modules is not None else None
+        self.det_size = det_size
+        self.ctx_id = ctx_id
+        self.ort_threads = ort_threads
+        self.model_factory = model_factory
+        self.stage_observer = stage_observer
+        self.photo_observer = photo_observer
+        self.quality_gate = quality_gate
+
+        # Photos are capped to max_image_side on their long edge at decode time
+        # (0 = keep full resolution). With adaptive_detection the detector runs
+        # on a copy downscaled to det_size and only the face crops come from
+        # the full-resolution image.
+        self.max_image_side = max_image_side
+        self.adaptive_detection = adaptive_detection
+
+        # Tiled detection (per request, see _detect_tiled) for wide shots with
+        # many small faces. Every tile thread shares one detector session, so
+        # tile threads times ORT intra-op threads must fit the cores.
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_nms_iou = tile_nms_iou
+        self.tile_workers = tile_workers
+        self._tile_executor = None
+        cores = os.cpu_count() or 1
+        if tile_workers > 1 and tile_workers * (ort_threads or cores) > cores:
+            print(f"[WARN] {tile_workers} tile workers x {ort_threads or cores} ORT threads oversubscribe "
+                  f"{cores} cores; set ORT_THREADS so their product fits")
+
+        # Seconds spent in each startup phase, reported by the service's /ready.
+        self.load_timings: dict[str, float] = {}
+
         print("Initializing InsightFace...")
-        self.app = FaceAnalysis(name=model_name)
-        self.app.prepare(ctx_id=ctx_id, det_size=det_size)
+        started = time.perf_counter()
+        self.app = self._build_model()
+        self.load_timings["models_s"] = round(time.perf_counter() - started, 3)
+
+        # Per-thread model handles for inference workers (see init_worker).
+        self._local = threading.local()
+        self._worker_lock = threading.Lock()
+        self._primary_claimed = False
+
+        # With a non-zero wait, recognition crops from concurrent requests are
+        # coalesced into shared ArcFace batches (see batching.py).
+        self.batcher = None
+        if batch_max_wait_ms > 0:
+            self.batcher = RecognitionBatcher(
+                self.app.models["recognition"].get_feat,
+                max_batch_size=batch_max_size,
+                max_wait_ms=batch_max_wait_ms,
+            )
+
+        # Detection results for uploaded photos, keyed by content hash (see
+        # result_cache.py). Disabled when cache_max_bytes is 0.
+        self.result_cache = DetectionCache(cache_max_bytes, cache_ttl_s) if cache_max_bytes > 0 else None
+        # Bumped on every registration; part of the result cache key.
+        self.gallery_version = 0
+        # Set in serve.py workers: a callable(rolls, names, embeddings, extras)
+        # that writes through the parent process instead of ChromaDB.
+        self.gallery_writer = None
+
+        # The Chroma client is shared by every worker thread; all collection
+        # calls go through this lock.
+        self._db_lock = threading.Lock()
+        self.client = self.collection = None
+        # Set once ChromaDB is open (and reconciled with a snapshot); writes
+        # wait for it.
+        self._store_ready = threading.Event()
+        # Snapshots hold a GalleryIndex, so only the memory backend uses them.
+        self.snapshot_path = snapshot_path if gallery_backend == "memory" else None
+        self._snapshot_dirty = False
 
+        # "memory" mirrors the collection into a NumPy matrix and matches
+        # against that exactly; "ivfpq" mirrors it into an approximate
+        # IVF-PQ index for very large galleries; "chroma" queries the HNSW
+        # index on every request.
+        self.gallery = None
+        snapshot = None
+        if self.snapshot_path:
+            started = time.perf_counter()
+            snapshot = load_snapshot(snapshot_path, gallery_dtype)
+
+        if snapshot is not None:
+            self.gallery, manifest = snapshot
+            self.load_timings["gallery_s"] = round(time.perf_counter() - started, 3)
+            print(f"Gallery mapped from snapshot: {len(self.gallery)} students ({gallery_dtype}), "
+                  f"version {manifest['version']}")
+            threading.Thread(
+                target=self._reconcile_store,
+                args=(db_path, collection_name),
+                name="gallery-reconcile",
+                daemon=True,
+            ).start()
+        else:
+            started = time.perf_counter()
+            self.client, self.collection = self._connect(db_path, collection_name)
+            if gallery_backend == "memory":
+                print("Loading gallery into memory...")
+                self.gallery = GalleryIndex.from_collection(self.collection, dtype=gallery_dtype)
+                print(f"Gallery loaded: {len(self.gallery)} students ({gallery_dtype})")
+                if self.snapshot_path:
+                    self._write_snapshot()
+            elif gallery_backend == "ivfpq":
+                print("Loading gallery into IVF-PQ index...")
+                self.gallery = IVFPQIndex.from_collection(
+                    self.collection, nlist=ivf_nlist, m=pq_m, nprobe=ivf_nprobe, refine_dtype=ivf_refine
+                )
+                state = "trained" if self.gallery.is_trained else "exact until trained"
+                print(f"Gallery loaded: {len(self.gallery)} students (IVF-PQ, {state})")
+            self.load_timings["gallery_s"] = round(time.perf_counter() - started, 3)
+            self._store_ready.set()
+        print("System ready.\n")
+
+    def _build_model(self) -> FaceAnalysis:
+        if self.model_factory is not None:
+            return self.model_factory()
+        # allowed_modules=None loads every model in the pack.
+        model = FaceAnalysis(name=self.model_name, allowed_modules=self.modules)
+        model.prepare(ctx_id=self.ctx_id, det_size=self.det_size)
+        if self.ort_threads:
+            _limit_ort_threads(model, self.ort_threads)
+        return model
+
+    def init_worker(self):
+        """
+        Give the calling thread its own InsightFace handle.
+
+        Meant as a thread-pool initializer. The first worker adopts the model
+        loaded in __init__; every further worker loads a private copy, so no
+        two workers ever run inference through the same handle.
+        """
+        with self._worker_lock:
+            adopt = not self._primary_claimed
+            self._primary_claimed = True
+        self._local.app = self.app if adopt else self._build_model()
+        self.warm_up()
+
+    def warm_up(self) -> float:
+        """
+        Push a dummy image through the calling thread's detector and
+        recognition model so ONNX Runtime allocates its buffers now rather
+        than on the first real photo. Returns the seconds it took.
+        """
+        started = time.perf_counter()
+        model = self._model
+        blank = np.zeros((self.det_size[1], self.det_size[0], 3), dtype=np.uint8)
+        model.det_model.detect(blank, max_num=0, metric="default")
+
+        # A blank image has no faces, so warm recognition with a blank crop.
+        rec_model = model.models["recognition"]
+        rec_model.get_feat([np.zeros((*rec_model.input_size[::-1], 3), dtype=np.uint8)])
+
+        elapsed = round(time.perf_counter() - started, 3)
+        self.load_timings["warmup_s"] = elapsed
+        return elapsed
+
+    def _connect(self, db_path: str | None, collection_name: str):
         print("Connecting to ChromaDB...")
-        self.client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.client.get_or_create_collection(
+        client = chromadb.PersistentClient(path=db_path) if db_path is not None else chromadb.EphemeralClient()
+        collection = client.get_or_create_collection(
             name=collection_name,
             metadata={"hnsw:space": "cosine"}
         )
-        print("System ready.\n")
+        return client, collection
+
+    def _reconcile_store(self, db_path: str | None, collection_name: str):
+        """Background half of a snapshot start: open ChromaDB and bring the mapped gallery up to date."""
+        try:
+            started = time.perf_counter()
+            client, collection = self._connect(db_path, collection_name)
+            diff = reconcile(self.gallery, collection)
+            if diff["removed"]:
+                # Rows cannot be deleted from the index; rebuild it.
+                self.gallery = GalleryIndex.from_collection(collection, dtype=self.gallery.dtype)
+            if diff["added"] or diff["changed"] or diff["removed"]:
+                self.gallery_version += 1
+                self._write_snapshot()
+            self.client, self.collection = client, collection
+            self.load_timings["reconcile_s"] = round(time.perf_counter() - started, 3)
+            print(f"[OK] Gallery reconciled with ChromaDB: {diff['added']} added, "
+                  f"{diff['changed']} changed, {diff['removed']} removed")
+        except Exception as exc:
+            print(f"[WARN] Gallery reconcile failed, registrations are disabled: {exc}")
+        finally:
+            self._store_ready.set()
+
+    def _write_snapshot(self):
+        started = time.perf_counter()
+        manifest = write_snapshot(self.gallery, self.snapshot_path)
+        self._snapshot_dirty = False
+        print(f"[OK] Gallery snapshot written: {manifest['count']} students "
+              f"in {time.perf_counter() - started:.2f}s")
+
+    @property
+    def store_ready(self) -> bool:
+        """False while ChromaDB is still being opened and reconciled in the background."""
+        return self._store_ready.is_set()
+
+    def wait_for_store(self, timeout: float | None = None) -> bool:
+        return self._store_ready.wait(timeout)
+
+    def gallery_size(self) -> int:
+        return len(self.index)
+
+    @property
+    def index(self) -> VectorIndex:
+        """What faces are matched against: the in-memory gallery, or ChromaDB itself."""
+        if self.gallery is not None:
+            return self.gallery
+        return ChromaIndex(self.collection, self._db_lock)
+
+    @property
+    def _model(self) -> FaceAnalysis:
+        return getattr(self._local, "app", self.app)
+
+    def after_fork(self):
+        """
+        Reset per-process state in a child forked after this system was built.
+
+        Threads do not survive fork(), so thread-locals, locks that may have
+        been held mid-fork and the helper threads (recognition batcher, tile
+        pool) are recreated. Models and the gallery are kept as inherited.
+        """
+        self._local = threading.local()
+        self._worker_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._primary_claimed = False
+        self._tile_executor = None
+        if self.batcher is not None:
+            self.batcher = RecognitionBatcher(
+                self.app.models["recognition"].get_feat,
+                max_batch_size=self.batcher.max_batch_size,
+                max_wait_ms=self.batcher.max_wait * 1000.0,
+            )
+        if self.result_cache is not None:
+            self.result_cache = DetectionCache(self.result_cache.max_bytes, self.result_cache.ttl_s)
+
+    def close(self):
+        """
+        Stop background helpers and save the gallery snapshot if it changed.
+        Call once no more photos will be processed.
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+        if self._tile_executor is not None:
+            self._tile_executor.shutdown(wait=True)
+        if self._snapshot_dirty and self.gallery_writer is None:
+            self._write_snapshot()
 
     # ------------------------------------------------------------------ #
     #  Private Helpers                                                     #
     # ------------------------------------------------------------------ #
 
-    def _load_image(self, image_path: str):
-        img = cv2.imread(image_path)
+    @contextmanager
+    def _stage(self, name: str):
+        """Time the enclosed block and report it to stage_observer, if set."""
+        observer = self.stage_observer
+        if observer is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            observer(name, time.perf_counter() - started)
+
+    def _load_image(self, image: ImageSource, full_resolution: bool = False) -> np.ndarray:
+        """
+        Decode a photo to a BGR array no larger than max_image_side.
+
+        Stays BGR: only the small detection copy and the aligned face crops
+        are converted to RGB, never the full-resolution image. Large JPEGs are
+        decoded at reduced resolution by libjpeg itself where that still
+        leaves at least max_image_side pixels. full_resolution skips both, for
+        callers holding coordinates in the original image.
+        """
+        if isinstance(image, np.ndarray):
+            return image if full_resolution else self._cap_resolution(image)
+
+        if isinstance(image, str):
+            try:
+                with open(image, "rb") as f:
+                    image = f.read()
+            except OSError:
+                raise FileNotFoundError(f"Could not load image: {image}")
+
+        flag = cv2.IMREAD_COLOR
+        size = _jpeg_size(image) if self.max_image_side and not full_resolution else None
+        if size is not None:
+            for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+                if max(size) // factor >= self.max_image_side:
+                    flag = reduced_flag
+                    break
+
+        img = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flag)
         if img is None:
-            raise FileNotFoundError(f"Could not load image: {image_path}")
+            raise ValueError("Could not decode image bytes")
+        return img if full_resolution else self._cap_resolution(img)
+
+    def _cap_resolution(self, img: np.ndarray) -> np.ndarray:
+        longest = max(img.shape[:2])
+        if not self.max_image_side or longest <= self.max_image_side:
+            return img
+        scale = self.max_image_side / longest
+        return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    def _get_embeddings(self, faces) -> np.ndarray:
+        # Stack every face into one (N, D) matrix and L2-normalise the rows
+        # in a single pass instead of one np.linalg.norm call per face.
+        embeddings = np.stack([face.embedding for face in faces]).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+    def _query_gallery(self, embeddings: np.ndarray, top_k: int = 1, roster: RosterFilter | None = None):
+        """
+        Look up every embedding in one batched search of the gallery backend
+        (see gallery.VectorIndex). A roster limits the search to those
+        students.
+
+        Returns an (N, k) similarity matrix, sorted best-first per row, and the
+        matching (N, k) nested list of metadata dicts.
+        """
+        return self.index.search(embeddings, top_k, roster)
+
+    def _detect_faces(self, image: ImageSource, tiled: bool = False, progress=None):
+        """
+        Same result as FaceAnalysis.get, but with recognition split out so all
+        faces in the photo are embedded in one batched model call, and faces
+        failing the quality gate dropped before it.
+
+        Returns the kept faces, the decoded BGR image and the gate's
+        {reason: count} of skipped faces.
+        """
+        if progress is not None:
+            progress("decode")
+        with self._stage("decode"):
+            img = self._load_image(image)
+        if progress is not None:
+            progress("detect")
+        with self._stage("detect"):
+            faces = self._run_detector(img, tiled=tiled)
+        skipped = {}
+        if self.quality_gate:
+            with self._stage("quality"):
+                faces, skipped = self.quality_gate.split(img, faces)
+        with self._stage("embed"):
+            self._embed_faces(img, faces)
+        return faces, img, skipped
+
+    def _run_detector(self, img: np.ndarray, tiled: bool = False) -> list:
+        """
+        Detect faces in a BGR image and run any non-recognition modules.
+
+        Boxes and keypoints are always in img's coordinates. No embeddings yet.
+        """
+        model = self._model
+        if tiled:
+            bboxes, kpss = self._detect_tiled(img, model.det_model)
+        else:
+            bboxes, kpss = self._detect_scaled(img, model.det_model)
+
+        extra_models = [m for name, m in model.models.items() if name not in ("detection", "recognition")]
+        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB) if extra_models and len(bboxes) else None
+
+        faces = []
+        for i in range(bboxes.shape[0]):
+            face = Face(
+                bbox=bboxes[i, 0:4],
+                kps=kpss[i] if kpss is not None else None,
+                det_score=bboxes[i, 4],
+            )
+            for task_model in extra_models:
+                task_model.get(rgb, face)
+            faces.append(face)
+        return faces
+
+    def _detect_scaled(self, img: np.ndarray, det_model):
+        """
+        One detector pass over the whole image.
+
+        With adaptive_detection, detection runs on a copy shrunk to fit
+        det_size (the detector would resize to that anyway) and boxes and
+        keypoints are scaled back to img's coordinates.
+        """
+        scale = 1.0
+        if self.adaptive_detection:
+            scale = min(1.0, max(self.det_size) / max(img.shape[:2]))
+        det_img = img if scale == 1.0 else cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        bboxes, kpss = det_model.detect(cv2.cvtColor(det_img, cv2.COLOR_BGR2RGB), max_num=0, metric="default")
+        if scale != 1.0:
+            bboxes[:, :4] /= scale
+            if kpss is not None:
+                kpss /= scale
+        return bboxes, kpss
+
+    def _detect_tiled(self, img: np.ndarray, det_model):
+        """
+        Detector passes over overlapping tile_size tiles, on tile_workers threads.
+
+        Each tile is seen at close to native resolution, so small faces in the
+        back rows of a wide shot are large enough for the detector. A whole-
+        image pass is added for faces bigger than the tile overlap, and
+        duplicates across tiles are merged with NMS. Tile detections touching
+        an interior tile edge are dropped first: any face smaller than the
+        overlap is whole in a neighbouring tile, and a larger one is found by
+        the whole-image pass.
+        """
+        h, w = img.shape[:2]
+        regions = [
+            (x, y, min(x + self.tile_size, w), min(y + self.tile_size, h))
+            for y in _tile_starts(h, self.tile_size, self.tile_overlap)
+            for x in _tile_starts(w, self.tile_size, self.tile_overlap)
+        ]
+
+        def detect_region(region):
+            x0, y0, x1, y1 = region
+            tile = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2RGB)
+            bboxes, kpss = det_model.detect(tile, max_num=0, metric="default")
+            bboxes[:, :4] += (x0, y0, x0, y0)
+            kpss += (x0, y0)
+            keep = _inside_tile(bboxes, region, img.shape)
+            return bboxes[keep], kpss.reshape(-1, 5, 2)[keep]
+
+        passes = list(self._tile_pool.map(detect_region, regions))
+        passes.append(self._detect_scaled(img, det_model))
+
+        bboxes = np.concatenate([b for b, _ in passes])
+        kpss = np.concatenate([k.reshape(-1, 5, 2) for _, k in passes])
+        keep = _nms(bboxes, self.tile_nms_iou)
+        return bboxes[keep], kpss[keep]
+
+    @property
+    def _tile_pool(self) -> ThreadPoolExecutor:
+        # Created on first tiled request; shared by every inference worker.
+        with self._worker_lock:
+            if self._tile_executor is None:
+                self._tile_executor = ThreadPoolExecutor(
+                    max_workers=self.tile_workers,
+                    thread_name_prefix="detect-tile",
+                )
+            return self._tile_executor
+
+    def _align(self, img: np.ndarray, face) -> np.ndarray:
+        """Aligned RGB recognition crop, cut from the full-resolution BGR image."""
+        rec_model = self._model.models["recognition"]
+        crop = face_align.norm_crop(img, landmark=face.kps, image_size=rec_model.input_size[0])
+        return cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+
+    def _prepared_crop(self, img: np.ndarray) -> np.ndarray:
+        """
+        RGB recognition input from an already aligned BGR face crop.
+
+        The crop must be square, as produced by insightface's norm_crop (or
+        any ArcFace-style alignment); other sizes are resized to the model's
+        input size.
+        """
+        size = self._model.models["recognition"].input_size[0]
+        h, w = img.shape[:2]
+        if abs(h - w) > 0.05 * max(h, w):
+            raise ValueError(f"Aligned face crops must be square ({size}x{size}), got {w}x{h}")
+        if (h, w) != (size, size):
+            interpolation = cv2.INTER_AREA if h > size else cv2.INTER_LINEAR
+            img = cv2.resize(img, (size, size), interpolation=interpolation)
         return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
-    def _get_embedding(self, face) -> list:
-        embedding = face.embedding
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding.tolist()
+    def _crop_from_box(self, img: np.ndarray, bbox, kps=None) -> np.ndarray:
+        """
+        Aligned RGB recognition crop for a face whose box (x0, y0, x1, y1),
+        and optionally 5-point landmarks, came with the photo.
+
+        Without landmarks they are placed at their average position in the
+        box, which aligns frontal faces well enough but less precisely than
+        real landmarks.
+        """
+        x0, y0, x1, y1 = (float(v) for v in bbox)
+        h, w = img.shape[:2]
+        if not (x1 > x0 and y1 > y0) or x1 <= 0 or y1 <= 0 or x0 >= w or y0 >= h:
+            raise ValueError(f"Face box {bbox} is empty or outside the {w}x{h} image")
+        if kps is None:
+            kps = _BOX_LANDMARKS * (x1 - x0, y1 - y0) + (x0, y0)
+        kps = np.asarray(kps, dtype=np.float32).reshape(5, 2)
+        return self._align(img, Face(bbox=np.array([x0, y0, x1, y1], dtype=np.float32), kps=kps, det_score=1.0))
+
+    def _face_crop(self, img: np.ndarray, aligned: bool = False, bbox=None, kps=None):
+        """
+        The registration crop for one photo, and how it was found.
+
+        aligned — img is itself an aligned face crop; bbox / kps — where the
+        face is in img. Either way only the recognition model will run.
+        Otherwise the detector runs and its most confident face is used.
+        Returns (None, reason) when no face is found.
+        """
+        if aligned:
+            return self._prepared_crop(img), "aligned crop"
+        if bbox is not None:
+            return self._crop_from_box(img, bbox, kps), "supplied box"
+
+        faces = self._run_detector(img)
+        if not faces:
+            return None, "No face detected"
+        best_face = max(faces, key=lambda f: f.det_score)
+        return self._align(img, best_face), f"best of {len(faces)} detected face(s), confidence {best_face.det_score:.3f}"
+
+    def _embed_crops(self, crops: list) -> np.ndarray:
+        if self.batcher is not None:
+            return self.batcher.embed(crops)
+        return self._model.models["recognition"].get_feat(crops)
+
+    def _embed_faces(self, img: np.ndarray, faces: list):
+        if not faces:
+            return
+
+        embeddings = self._embed_crops([self._align(img, face) for face in faces])
+        for face, embedding in zip(faces, embeddings):
+            face.embedding = embedding.flatten()
 
-    def _detect_faces(self, image_path: str):
-        img = self._load_image(image_path)
-        return self.app.get(img), img
+    def _upsert_students(self, rolls: list[str], names: list[str], embeddings: np.ndarray, extras: list | None = None):
+        """
+        Write normalised embeddings to ChromaDB and the in-memory gallery in one go.
+
+        extras optionally holds per-student branch / year for roster filtering.
+        """
+        if self.gallery_writer is not None:
+            self.gallery_writer(rolls, names, embeddings, extras)
+            return
+        self._store_ready.wait()
+        if self.collection is None:
+            raise RuntimeError("ChromaDB is unavailable; registrations are disabled")
+
+        ChromaIndex(self.collection, self._db_lock).upsert_many(rolls, names, embeddings, extras)
+        if self.gallery is not None:
+            self.gallery.upsert_many(rolls, names, embeddings, extras)
+            self._snapshot_dirty = self.snapshot_path is not None
+        self.gallery_version += 1
 
     # ------------------------------------------------------------------ #
     #  Registration                                                        #
     # ------------------------------------------------------------------ #
 
-    def register_student(self, image_path: str, roll_number: str, name: str) -> bool:
-        faces, _ = self._detect_faces(image_path)
+    def register_student(
+        self,
+        image: ImageSource,
+        roll_number: str,
+        name: str,
+        branch: str | None = None,
+        year: int | None = None,
+        aligned: bool = False,
+        bbox=None,
+        kps=None,
+    ) -> bool:
+        """
+        Embed one student's face and store it.
 
-        if len(faces) == 0:
+        By default the detector finds the face. A kiosk that already has it
+        can skip detection: aligned=True when image is an aligned face crop
+        (112x112 for buffalo_l), or bbox=(x0, y0, x1, y1) in image pixels,
+        optionally with kps, the five (x, y) landmarks.
+        """
+        img = self._load_image(image, full_resolution=bbox is not None)
+        crop, source = self._face_crop(img, aligned, bbox, kps)
+
+        if crop is None:
             print(f"[WARN] No face detected for {name}")
             return False
+        print(f"[INFO] Using {source}")
 
-        best_face = max(faces, key=lambda f: f.det_score)
-        print(f"[INFO] Detected {len(faces)} face(s) — using best confidence: {best_face.det_score:.3f}")
-
-        # upsert instead of add so re-registering the same roll number
-        # updates the embedding rather than throwing a duplicate ID error.
-        self.collection.upsert(
-            embeddings=[self._get_embedding(best_face)],
-            ids=[roll_number],
-            metadatas=[{"name": name, "roll": roll_number}]
-        )
+        embedding = self._embed_crops([crop]).astype(np.float32).reshape(1, -1)
+        embedding /= np.linalg.norm(embedding, axis=1, keepdims=True)
+        self._upsert_students([roll_number], [name], embedding, [_roster_metadata(branch, year)])
 
         print(f"[OK] Registered {name} ({roll_number})")
         return True
 
+    def register_students(self, entries: list, decode_workers: int = 4, batch_size: int = 64) -> list:
+        """
+        Bulk version of register_student for enrolling a whole batch at once.
+
+        entries — list of (image, roll_number, name) tuples, optionally with a
+                  fourth dict of "branch" / "year" for roster filtering and
+                  "aligned" / "bbox" / "kps" as in register_student.
+
+        Images are decoded in parallel, the face of each (detected, or given
+        by aligned / bbox) is embedded in batches of batch_size, and
+        everything is written with one upsert.
+        Returns one {"roll", "name", "success", "error"} report per entry,
+        in input order.
+        """
+        rolls = [entry[1] for entry in entries]
+        if len(set(rolls)) != len(rolls):
+            raise ValueError("Each roll number may appear only once per batch")
+
+        def decode(entry):
+            options = entry[3] if len(entry) > 3 else {}
+            try:
+                return self._load_image(entry[0], full_resolution=options.get("bbox") is not None), None
+            except (ValueError, FileNotFoundError) as exc:
+                return None, str(exc)
+
+        reports = []
+        crops, rows, extras = [], [], []
+        with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+            # Decode decode_workers photos at a time so only a handful of
+            # full-resolution images are in memory; only 112x112 crops are kept.
+            for start in range(0, len(entries), decode_workers):
+                chunk = entries[start:start + decode_workers]
+                for entry, (img, error) in zip(chunk, pool.map(decode, chunk)):
+                    _, roll, name = entry[:3]
+                    report = {"roll": roll, "name": name, "success": False, "error": error}
+                    reports.append(report)
+                    if img is None:
+                        continue
+
+                    options = entry[3] if len(entry) > 3 else {}
+                    try:
+                        crop, source = self._face_crop(
+                            img, options.get("aligned", False), options.get("bbox"), options.get("kps")
+                        )
+                    except ValueError as exc:
+                        crop, source = None, str(exc)
+                    if crop is None:
+                        report["error"] = source
+                        continue
+
+                    crops.append(crop)
+                    rows.append(report)
+                    extras.append(_roster_metadata(options.get("branch"), options.get("year")))
+
+        if rows:
+            embeddings = np.concatenate([
+                self._embed_crops(crops[start:start + batch_size])
+                for start in range(0, len(crops), batch_size)
+            ]).astype(np.float32)
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+            self._upsert_students(
+                [report["roll"] for report in rows],
+                [report["name"] for report in rows],
+                embeddings,
+                extras,
+            )
+            for report in rows:
+                report["success"] = True
+
+        print(f"[OK] Registered {len(rows)}/{len(entries)} students in bulk")
+        return reports
+
     # ------------------------------------------------------------------ #
     #  Attendance                                                          #
     # ------------------------------------------------------------------ #
 
-    def mark_attendance(self, group_photo_path: str, threshold: float = 0.45) -> list:
-        faces, _ = self._detect_faces(group_photo_path)
-        print(f"[INFO] Detected {len(faces)} faces in photo")
+    def _match(self, embeddings, threshold: float, top_k: int = 1, roster: RosterFilter | None = None):
+        """
+        Match normalised embeddings against the gallery.
 
-        attendance = []
-        unrecognized = 0
+        Returns one {"roll", "name", "similarity"} record per embedding that
+        clears the threshold, the number that did not, and the index of the
+        embedding behind each record.
+        """
+        matched = np.zeros(0, dtype=np.int64)
+        if embeddings is None or len(embeddings) == 0:
+            return [], 0, matched
 
-        for face in faces:
-            results = self.collection.query(
-                query_embeddings=[self._get_embedding(face)],
-                n_results=1
-            )
+        attendance = []
+        unrecognized = len(embeddings)
+        with self._stage("match"):
+            similarities, metadatas = self._query_gallery(embeddings, top_k, roster)
 
-            similarity = 1 - results["distances"][0][0]
+        # Best match per face is column 0 (results come back nearest first).
+        if similarities.shape[1] > 0:
+            best = similarities[:, 0]
+            matched = np.flatnonzero(best >= threshold)
+            unrecognized = len(embeddings) - len(matched)
 
-            if similarity >= threshold:
-                meta = results["metadatas"][0][0]
+            for i in matched:
+                meta = metadatas[i][0]
                 attendance.append({
                     "roll": meta["roll"],
                     "name": meta["name"],
-                    "similarity": round(similarity, 3)
+                    "similarity": round(float(best[i]), 3)
                 })
-            else:
-                unrecognized += 1
+
+        return attendance, unrecognized, matched
+
+    def _detect_cached(self, image: ImageSource, tiled: bool, progress=None):
+        """
+        Boxes, scores and normalised embeddings of every face in a photo.
+
+        Encoded uploads are looked up in the result cache by content hash
+        first, so a re-upload of the same photo skips decode and inference.
+
+        Returns the CachedDetection and the decoded BGR image, or None for
+        the image on a cache hit.
+        """
+        key = None
+        if self.result_cache is not None and isinstance(image, (bytes, bytearray, memoryview)):
+            key = (hashlib.blake2b(image, digest_size=16).digest(), self.gallery_version, tiled)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return cached, None
+
+        faces, img, skipped = self._detect_faces(image, tiled=tiled, progress=progress)
+        detection = CachedDetection(
+            embeddings=self._get_embeddings(faces) if faces else np.zeros((0, 0), dtype=np.float32),
+            bboxes=np.array([face.bbox for face in faces], dtype=np.float32).reshape(-1, 4),
+            det_scores=np.array([face.det_score for face in faces], dtype=np.float32),
+            skipped=skipped,
+        )
+        if key is not None:
+            self.result_cache.put(key, detection)
+        return detection, img
+
+    def analyze_photo(
+        self,
+        group_photo: ImageSource,
+        threshold: float = 0.45,
+        top_k: int = 1,
+        tiled: bool = False,
+        roster: RosterFilter | None = None,
+        progress=None,
+        keep_image: bool = False,
+    ) -> PhotoResult:
+        """
+        Detect, embed and match every face in a group photo, once.
+
+        The PhotoResult keeps the boxes and per-face matches, so the photo
+        can be rendered with render_detections without running the detector
+        again. keep_image also keeps the decoded photo for that purpose.
+
+        progress — optional callable, called with "decode", "detect" and
+                   "match" as the photo enters each stage (decode and detect
+                   are skipped on a result cache hit).
+        """
+        detection, img = self._detect_cached(group_photo, tiled, progress)
+        skipped_count = sum(detection.skipped.values())
+        print(f"[INFO] Detected {len(detection.bboxes) + skipped_count} faces in photo")
+        if skipped_count:
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in detection.skipped.items())
+            print(f"[INFO] Skipped {skipped_count} low-quality faces ({reasons})")
+
+        if progress is not None:
+            progress("match")
+        attendance, unrecognized, matched = self._match(detection.embeddings, threshold, top_k, roster)
 
         print(f"\n[RESULT] Attendance Marked : {len(attendance)} students")
         print(f"[RESULT] Unrecognized faces: {unrecognized}")
         for record in attendance:
             print(f"  ✓ {record['name']} ({record['roll']}) — confidence: {record['similarity']}")
+        if self.photo_observer is not None:
+            self.photo_observer(len(detection.bboxes) + skipped_count, len(attendance), unrecognized,
+                                detection.skipped)
+
+        matches = [None] * len(detection.bboxes)
+        for i, record in zip(matched, attendance):
+            matches[i] = record
+
+        if keep_image and img is None:
+            # Cache hit: only the decode is redone, never detection.
+            img = self._load_image(group_photo)
+        return PhotoResult(attendance, unrecognized, detection, matches, img if keep_image else None)
+
+    def mark_attendance(
+        self,
+        group_photo: ImageSource,
+        threshold: float = 0.45,
+        top_k: int = 1,
+        tiled: bool = False,
+        roster: RosterFilter | None = None,
+        progress=None,
+    ) -> list:
+        """Roll numbers of everyone recognised in a group photo (see analyze_photo)."""
+        return self.analyze_photo(group_photo, threshold, top_k, tiled, roster, progress).attendance
+
+    def match_embeddings(
+        self,
+        embeddings: np.ndarray,
+        threshold: float = 0.45,
+        roster: RosterFilter | None = None,
+    ) -> list:
+        """
+        Roll numbers for face embeddings computed elsewhere, e.g. on a camera
+        that runs the detector and ArcFace itself.
 
+        embeddings — (N, D) array, one row per face, as the recognition model
+                     outputs them. Rows are re-normalised here, so float16
+                     rounding or unnormalised rows do not shift similarities.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            raise ValueError("Embeddings must be a 2-D array of one row per face")
+        dim = self.index.dim if len(embeddings) else None
+        if dim is not None and embeddings.shape[1] != dim:
+            raise ValueError(f"Embeddings have {embeddings.shape[1]} dimensions, the gallery {dim}")
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        if not np.all(np.isfinite(norms)) or np.any(norms == 0):
+            raise ValueError("Embeddings must be finite and non-zero")
+        embeddings = embeddings / norms
+
+        attendance, unrecognized, _ = self._match(embeddings, threshold, roster=roster)
+        print(f"[RESULT] Matched {len(attendance)} of {len(embeddings)} supplied embeddings")
+        if self.photo_observer is not None:
+            self.photo_observer(len(embeddings), len(attendance), unrecognized, {})
         return attendance
 
+    def mark_attendance_frames(
+        self,
+        frames,
+        threshold: float = 0.45,
+        samples_per_track: int = 3,
+        time_budget_s: float = 20.0,
+        roster: RosterFilter | None = None,
+    ) -> dict:
+        """
+        Attendance from a video clip or burst of frames.
+
+        frames — iterable of ImageSource, e.g. video.sample_video(...).
+
+        Faces are detected on every frame and linked across frames by
+        IoUTracker; only the samples_per_track highest-scoring crops of each
+        track are embedded, and their mean embedding is matched once per
+        track. The best similarity per roll wins. Frames stop being read once
+        time_budget_s seconds are spent, bounding the cost of long clips.
+        Faces failing the quality gate still keep their track alive but are
+        never offered as samples.
+        """
+        tracker = IoUTracker()
+        started = time.perf_counter()
+        processed = 0
+        truncated = False
+        skipped = Counter()
+
+        try:
+            for frame in frames:
+                if time.perf_counter() - started > time_budget_s:
+                    truncated = True
+                    break
+
+                img = self._load_image(frame)
+                faces = self._run_detector(img)
+                processed += 1
+                if not faces:
+                    tracker.update(np.zeros((0, 4), dtype=np.float32))
+                    continue
+
+                tracks = tracker.update(np.stack([face.bbox for face in faces]))
+                for face, track in zip(faces, tracks):
+                    reason = self.quality_gate.check(img, face) if self.quality_gate else None
+                    if reason is not None:
+                        skipped[reason] += 1
+                        continue
+                    track.offer(float(face.det_score), lambda: self._align(img, face), samples_per_track)
+        finally:
+            if hasattr(frames, "close"):
+                frames.close()
+
+        tracks = [track for track in tracker.tracks if track.samples]
+        attendance, unrecognized = [], 0
+        crop_count = sum(len(track.samples) for track in tracks)
+
+        if tracks:
+            crops = [crop for track in tracks for _, crop in track.samples]
+            embeddings = self._embed_crops(crops).astype(np.float32)
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+            # Mean of each track's normalised sample embeddings, renormalised.
+            bounds = np.cumsum([0] + [len(track.samples) for track in tracks])
+            per_track = np.stack([embeddings[a:b].mean(axis=0) for a, b in zip(bounds[:-1], bounds[1:])])
+            per_track /= np.linalg.norm(per_track, axis=1, keepdims=True)
+
+            matches, unrecognized, _ = self._match(per_track, threshold, roster=roster)
+            best_by_roll = {}
+            for record in matches:
+                if record["roll"] not in best_by_roll or record["similarity"] > best_by_roll[record["roll"]]["similarity"]:
+                    best_by_roll[record["roll"]] = record
+            attendance = sorted(best_by_roll.values(), key=lambda r: r["similarity"], reverse=True)
+
+        print(f"[RESULT] {processed} frame(s), {len(tracks)} face track(s), "
+              f"{crop_count} crop(s) embedded, {len(attendance)} student(s) recognised")
+
+        return {
+            "attendance": attendance,
+            "frames_processed": processed,
+            "tracks": len(tracks),
+            "embedded_crops": crop_count,
+            "unrecognized_tracks": unrecognized,
+            "skipped_faces": dict(skipped),
+            "truncated": truncated,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        }
+
     # ------------------------------------------------------------------ #
     #  Visualization                                                       #
     # ------------------------------------------------------------------ #
 
-    def visualize_detections(self, group_photo_path: str, output_path: str = "detections.jpg"):
-        img_bgr = cv2.imread(group_photo_path)
-        faces = self.app.get(cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB))
+    def render_detections(self, result: PhotoResult, group_photo: ImageSource | None = None) -> np.ndarray:
+        """
+        Draw a PhotoResult's boxes onto its photo: recognised faces in green
+        with their roll number, the rest in red with the detection score.
 
-        for i, face in enumerate(faces):
-            box = face.bbox.astype(int)
-            conf = face.det_score
+        Uses the image kept by analyze_photo(keep_image=True), else decodes
+        group_photo again (decode only, no detection).
+        """
+        img_bgr = result.image if result.image is not None else self._load_image(group_photo)
+        img_bgr = img_bgr.copy()
 
-            cv2.rectangle(img_bgr, (box[0], box[1]), (box[2], box[3]), (0, 255, 0), 2)
-            cv2.putText(img_bgr, f"#{i+1} {conf:.2f}", (box[0], box[1] - 8),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        for i, (bbox, conf, match) in enumerate(zip(result.bboxes, result.det_scores, result.matches)):
+            box = bbox.astype(int)
+            if match is not None:
+                color, label = (0, 255, 0), f"{match['roll']} {match['similarity']:.2f}"
+            else:
+                color, label = (0, 0, 255), f"#{i+1} {conf:.2f}"
 
-        cv2.imwrite(output_path, img_bgr)
-        print(f"[INFO] Saved detection image → {output_path} ({len(faces)} faces)")
+            cv2.rectangle(img_bgr, (box[0], box[1]), (box[2], box[3]), color, 2)
+            cv2.putText(img_bgr, label, (box[0], box[1] - 8),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        return img_bgr
+
+    def visualize_detections(
+        self,
+        group_photo: ImageSource,
+        output_path: str = "detections.jpg",
+        result: PhotoResult | None = None,
+    ):
+        """Save the rendered detections; pass the result of an earlier analyze_photo to reuse it."""
+        if result is None:
+            result = self.analyze_photo(group_photo, keep_image=True)
+        cv2.imwrite(output_path, self.render_detections(result, group_photo))
+        print(f"[INFO] Saved detection image → {output_path} ({len(result.bboxes)} faces)")
 
 
 if __name__ == "__main__":
@@ -133,5 +1182,5 @@ if __name__ == "__main__":
     system.register_student("../photos/chinmay.png", "B22BB001", "Chinmay Vashisth")
     system.register_student("../photos/vignesh.png", "B22CS099", "Vignesh something something")
 
-    attendance = system.mark_attendance("../photos/group.png", 0.25)
-    system.visualize_detections("../photos/group.png", "group_detections.jpg")
\ No newline at end of file
+    result = system.analyze_photo("../photos/group.png", 0.25, keep_image=True)
+    system.visualize_detections("../photos/group.png", "group_detections.jpg", result)
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""
+Vector indexes that FaceAttendanceSystem matches faces against.
+
+VectorIndex is the interface: upsert_many, search and len(). Implementations:
+
+  GalleryIndex — in-memory mirror of the ChromaDB "students" collection,
+                 exact search (GALLERY_BACKEND=memory)
+  ChromaIndex  — queries the collection's own HNSW index (chroma)
+  IVFPQIndex   — approximate inverted-file / product-quantisation mirror for
+                 very large galleries, in ivfpq.py (ivfpq)
+
+GalleryIndex holds every registered embedding in one contiguous matrix so a
+whole group photo can be matched with a single matrix multiply. ChromaDB
+stays the store of record; in-memory indexes are rebuilt from it at startup
+and kept in sync by FaceAttendanceSystem whenever a student is
+(re-)registered.
+
+The matrix can be kept as float32, float16 (half the memory) or int8 with one
+float32 scale per vector (a quarter of the memory). Compact matrices are
+scored block by block, so only block_rows rows are ever widened to float32.
+That widening is cheap for int8 but not for float16: NumPy converts half
+floats element by element, and a float16 search takes about twice as long as
+float32 (110 ms against 63 ms for 60 faces and 50k students on one core in
+benchmarks/gallery_precision), while int8 stays within ~10% of float32. Prefer int8 for memory;
+float16 only saves less of it, more slowly.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+
+
+class RosterFilter:
+    """
+    Restricts matching to the students expected at an event.
+
+    Any combination of an explicit roll list and the branch / year metadata
+    stored at registration; every given condition must hold.
+    """
+
+    def __init__(self, rolls: list[str] | None = None, branch: str | None = None, year: int | None = None):
+        self.rolls = sorted(set(rolls)) if rolls else None
+        self.branch = branch or None
+        self.year = year
+
+    def __bool__(self) -> bool:
+        return self.rolls is not None or self.branch is not None or self.year is not None
+
+    @property
+    def key(self) -> tuple:
+        return (tuple(self.rolls) if self.rolls is not None else None, self.branch, self.year)
+
+    def matches(self, meta: dict) -> bool:
+        return (
+            (self.branch is None or meta.get("branch") == self.branch)
+            and (self.year is None or meta.get("year") == self.year)
+        )
+
+    def chroma_where(self) -> dict | None:
+        """The same filter as a ChromaDB where clause."""
+        clauses = []
+        if self.rolls is not None:
+            clauses.append({"roll": {"$in": self.rolls}})
+        if self.branch is not None:
+            clauses.append({"branch": {"$eq": self.branch}})
+        if self.year is not None:
+            clauses.append({"year": {"$eq": self.year}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+class VectorIndex:
+    """Interface shared by every gallery backend."""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def upsert_many(self, rolls: list[str], names: list[str], embeddings: np.ndarray, metadatas: list | None = None):
+        """
+        Insert or replace rows. Embeddings are expected to be L2-normalised.
+
+        metadatas optionally carries extra fields per row (branch, year) used
+        by RosterFilter.
+        """
+        raise NotImplementedError
+
+    def search(self, queries: np.ndarray, top_k: int = 1, roster: RosterFilter | None = None):
+        """
+        Nearest students for a batch of normalised queries.
+
+        Returns an (N, k) cosine similarity matrix, sorted best-first per row,
+        and the matching (N, k) nested list of metadata dicts ({"roll",
+        "name", ...}). With a roster, only the matching students are
+        candidates.
+        """
+        raise NotImplementedError
+
+
+class ChromaIndex(VectorIndex):
+    """
+    A Chroma collection behind the VectorIndex interface.
+
+    The client is not thread-safe, so every call holds lock, which callers
+    share with any other use of the same collection.
+    """
+
+    def __init__(self, collection, lock=None, batch_size: int = 5000):
+        self.collection = collection
+        self._lock = lock or threading.Lock()
+        self.batch_size = batch_size
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.collection.count()
+
+    @property
+    def dim(self) -> int | None:
+        """Width of the stored embeddings, read from one row; None while the collection is empty."""
+        with self._lock:
+            page = self.collection.get(limit=1, include=["embeddings"])
+        embeddings = page["embeddings"]
+        return len(embeddings[0]) if embeddings is not None and len(embeddings) else None
+
+    def upsert_many(self, rolls: list[str], names: list[str], embeddings: np.ndarray, metadatas: list | None = None):
+        metadatas = metadatas or [{} for _ in rolls]
+        records = [{**extra, "name": name, "roll": roll} for roll, name, extra in zip(rolls, names, metadatas)]
+        # upsert instead of add so re-registering the same roll number
+        # updates the embedding rather than throwing a duplicate ID error.
+        # ChromaDB rejects calls above its max batch size, so large rosters
+        # go in chunks.
+        with self._lock:
+            for start in range(0, len(rolls), self.batch_size):
+                end = start + self.batch_size
+                self.collection.upsert(embeddings=embeddings[start:end], ids=rolls[start:end], metadatas=records[start:end])
+
+    def search(self, queries: np.ndarray, top_k: int = 1, roster: RosterFilter | None = None):
+        """One ChromaDB round trip; a roster becomes a where filter."""
+        where = roster.chroma_where() if roster else None
+        with self._lock:
+            n_results = min(top_k, self.collection.count())
+            if n_results == 0:
+                return np.zeros((len(queries), 0), dtype=np.float32), [[] for _ in queries]
+
+            results = self.collection.query(
+                query_embeddings=queries,
+                n_results=n_results,
+                where=where,
+                include=["metadatas", "distances"],
+            )
+        similarities = 1 - np.asarray(results["distances"], dtype=np.float32)
+        return similarities, results["metadatas"]
+
+
+class GalleryIndex(VectorIndex):
+
+    def __init__(self, dim: int = 512, capacity: int = 1024, dtype: str = "float32", block_rows: int = 1024):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown gallery dtype: {dtype!r}")
+
+        self.dim = dim
+        self.dtype = dtype
+        self.block_rows = block_rows
+        # Per-vector dequantisation scales are kept for int8 only.
+        self._matrix, self._scales = self._allocate(capacity)
+        self._rolls: list[str] = []
+        self._metas: list[dict] = []
+        self._row_of: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Row subsets (and their sliced matrices) for recently used rosters,
+        # dropped whenever the gallery changes.
+        self._roster_slices: OrderedDict = OrderedDict()
+        self._max_roster_slices = 8
+
+    # ------------------------------------------------------------------ #
+    #  Loading / Updates                                                   #
+    # ------------------------------------------------------------------ #
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000, dtype: str = "float32") -> "GalleryIndex":
+        """Build an index from every record currently stored in a Chroma collection."""
+        total = collection.count()
+        index = None
+
+        for offset in range(0, total, batch_size):
+            page = collection.get(
+                include=["embeddings", "metadatas"],
+                limit=batch_size,
+                offset=offset,
+            )
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if index is None:
+                index = cls(dim=embeddings.shape[1], capacity=max(total, 1), dtype=dtype)
+            index.upsert_many(
+                [meta["roll"] for meta in page["metadatas"]],
+                [meta["name"] for meta in page["metadatas"]],
+                embeddings,
+                page["metadatas"],
+            )
+
+        return index if index is not None else cls(dtype=dtype)
+
+    @classmethod
+    def from_arrays(cls, matrix: np.ndarray, metadatas: list[dict], scales: np.ndarray | None = None,
+                    block_rows: int = 1024) -> "GalleryIndex":
+        """
+        Wrap existing row storage without copying it, e.g. a memory-mapped
+        snapshot. metadatas holds one {"roll", "name", ...} dict per row.
+        """
+        index = cls(dim=matrix.shape[1], capacity=0, dtype=str(matrix.dtype), block_rows=block_rows)
+        index._matrix, index._scales = matrix, scales
+        index._metas = list(metadatas)
+        index._rolls = [meta["roll"] for meta in index._metas]
+        index._row_of = {roll: row for row, roll in enumerate(index._rolls)}
+        return index
+
+    def upsert_many(self, rolls: list[str], names: list[str], embeddings: np.ndarray, metadatas: list | None = None):
+        """
+        Insert or replace rows. Embeddings are expected to be L2-normalised.
+
+        metadatas optionally carries extra fields per row (branch, year) used
+        by RosterFilter.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        rows, scales = self._encode(embeddings)
+        metadatas = metadatas or [{} for _ in rolls]
+
+        with self._lock:
+            self._roster_slices.clear()
+            for i, (roll, name, extra) in enumerate(zip(rolls, names, metadatas)):
+                meta = {**extra, "roll": roll, "name": name}
+                row = self._row_of.get(roll)
+                if row is None:
+                    row = len(self._rolls)
+                    self._grow(row + 1)
+                    self._row_of[roll] = row
+                    self._rolls.append(roll)
+                    self._metas.append(meta)
+                else:
+                    self._metas[row] = meta
+                self._matrix[row] = rows[i]
+                if scales is not None:
+                    self._scales[row] = scales[i]
+
+    def upsert(self, roll: str, name: str, embedding: np.ndarray):
+        self.upsert_many([roll], [name], embedding)
+
+    def _encode(self, embeddings: np.ndarray):
+        if self.dtype == "float32":
+            return embeddings, None
+        if self.dtype == "float16":
+            return embeddings.astype(np.float16), None
+
+        # Symmetric int8: each vector scaled so its largest component is ±127.
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        rows = np.round(embeddings / scales[:, None]).astype(np.int8)
+        return rows, scales.astype(np.float32)
+
+    def _allocate(self, capacity: int):
+        """Zeroed (matrix, scales) storage for capacity rows; scales is None unless int8."""
+        matrix = np.zeros((capacity, self.dim), dtype=np.dtype(self.dtype))
+        scales = np.zeros(capacity, dtype=np.float32) if self.dtype == "int8" else None
+        return matrix, scales
+
+    def _grow(self, needed: int):
+        if needed <= len(self._matrix):
+            return
+        capacity = max(needed, 2 * len(self._matrix))
+        size = len(self._rolls)
+
+        matrix, scales = self._allocate(capacity)
+        matrix[:size] = self._matrix[:size]
+        if scales is not None:
+            scales[:size] = self._scales[:size]
+        self._matrix, self._scales = matrix, scales
+
+    # ------------------------------------------------------------------ #
+    #  Search                                                              #
+    # ------------------------------------------------------------------ #
+
+    def __len__(self) -> int:
+        return len(self._rolls)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the stored vectors (and scales) for registered rows."""
+        size = len(self._rolls)
+        total = self._matrix[:size].nbytes
+        if self._scales is not None:
+            total += self._scales[:size].nbytes
+        return total
+
+    def _scores(self, queries: np.ndarray, matrix: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        """(N, len(matrix)) cosine similarities of normalised queries to every row."""
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.dtype == "float32":
+            return queries @ matrix.T
+
+        scores = np.empty((len(queries), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), self.block_rows):
+            stop = min(start + self.block_rows, len(matrix))
+            block = matrix[start:stop].astype(np.float32)
+            scores[:, start:stop] = queries @ block.T
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def _roster_slice(self, roster: RosterFilter):
+        """Row ids matching a roster, with the matrix (and scales) pre-sliced to them."""
+        cached = self._roster_slices.get(roster.key)
+        if cached is not None:
+            self._roster_slices.move_to_end(roster.key)
+            return cached
+
+        if roster.rolls is not None:
+            candidates = [self._row_of[roll] for roll in roster.rolls if roll in self._row_of]
+        else:
+            candidates = range(len(self._rolls))
+        rows = np.array([row for row in candidates if roster.matches(self._metas[row])], dtype=np.int64)
+
+        sliced = (
+            rows,
+            self._matrix[rows],
+            self._scales[rows] if self._scales is not None else None,
+        )
+        self._roster_slices[roster.key] = sliced
+        if len(self._roster_slices) > self._max_roster_slices:
+            self._roster_slices.popitem(last=False)
+        return sliced
+
+    def search(self, queries: np.ndarray, top_k: int = 1, roster: RosterFilter | None = None):
+        """
+        Exact cosine search for a batch of normalised queries.
+
+        With a roster, only the matching students are scored.
+
+        Returns an (N, k) similarity matrix, sorted best-first per row, and the
+        matching (N, k) nested list of metadata dicts ({"roll", "name", ...}) —
+        the same shape FaceAttendanceSystem gets back from ChromaDB.
+
+        The lock is only held to take views of the first size rows (or a
+        roster's sliced copy); scoring runs outside it, so searches from
+        several inference threads proceed in parallel. A grow replaces the
+        arrays rather than resizing them and new students land past size, so
+        the views stay valid; a search racing the re-registration of a
+        student may score that one row against a mix of the old and new
+        embedding.
+        """
+        with self._lock:
+            metas = self._metas
+            if roster:
+                row_ids, matrix, scales = self._roster_slice(roster)
+            else:
+                size = len(self._rolls)
+                row_ids = None
+                matrix = self._matrix[:size]
+                scales = self._scales[:size] if self._scales is not None else None
+
+        k = min(top_k, len(matrix))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), [[] for _ in queries]
+
+        scores = self._scores(queries, matrix, scales)
+
+        if k == 1:
+            top = scores.argmax(axis=1)[:, None]
+        else:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+            top = np.take_along_axis(top, order, axis=1)
+
+        similarities = np.take_along_axis(scores, top, axis=1)
+        if row_ids is not None:
+            top = row_ids[top]
+        metadatas = [[metas[j] for j in row] for row in top]
+        return similarities, metadatas
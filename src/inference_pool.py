@@ -0,0 +1,75 @@
+"""
+Bounded thread pool that runs face inference off the asyncio event loop.
+
+The FastAPI routes are async, but InsightFace/ONNX inference and ChromaDB
+calls are blocking. Routing them through this pool keeps the event loop free
+to accept requests (and answer /health) while photos are being processed;
+requests beyond the pool size simply queue for the next free worker.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferencePool:
+
+    def __init__(self, workers: int = 1, initializer=None):
+        """
+        workers     — number of concurrent inference threads.
+        initializer — called once in each worker thread before its first job,
+                      e.g. to give the thread its own model handle.
+        """
+        self.workers = workers
+        # Jobs submitted but not yet started, and jobs running right now.
+        self._queued = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="inference",
+            initializer=initializer,
+        )
+
+    async def start(self, timeout: float = 600.0):
+        """
+        Spawn every worker now instead of on first use.
+
+        ThreadPoolExecutor creates threads lazily, so this submits one job per
+        worker that waits on a shared barrier — each job is forced onto its own
+        thread, and each thread runs the initializer before returning.
+        """
+        barrier = threading.Barrier(self.workers, timeout=timeout)
+        await asyncio.gather(*(self.run(barrier.wait) for _ in range(self.workers)))
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread and await its result."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._queued += 1
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, args, kwargs))
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker."""
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        """Jobs currently running on a worker."""
+        return self._active
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work; with wait=True, let queued and running jobs finish first."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,493 @@
+"""
+Approximate gallery search for very large galleries: an inverted-file index
+with product quantisation (IVF-PQ) in pure NumPy.
+
+Exact search scores every registered vector for every face. IVF-PQ trades
+a little recall for time by shortlisting candidates cheaply:
+
+  - Coarse quantiser: k-means splits the gallery into nlist cells. A query
+    only looks at the students in its nprobe nearest cells.
+  - Product quantiser: each vector's residual from its cell centroid is cut
+    into m sub-vectors, and each sub-vector is stored as the one-byte id of
+    its nearest of 256 learned sub-centroids, so a row is m bytes.
+
+A shortlist score is the similarity to the reconstruction x̂ = centroid +
+Σ_j codebook_j[code_j]: q·centroid + Σ_j q_j·codebook_j[code_j], divided by
+‖x̂‖. The sum is read from a per-query (m, 256) lookup table, so a candidate
+costs m table lookups instead of a dot product.
+
+Those scores are too rough to compare with the match threshold (off by up
+to 0.16 at m=64 and 0.44 at m=16 on random vectors), so the index also keeps
+a GalleryIndex copy of every vector (refine_dtype, int8 by default) and
+re-scores the best rerank candidates per face against it. Returned
+similarities are those of an exact search in that dtype (int8: within
+0.0015), and m only has to be large enough to rank the true match into the
+shortlist. Memory is therefore about that of an int8 GalleryIndex; the gain
+is latency. Face-to-face similarity of a genuine match is only ~0.5-0.8,
+which is what limits recall: the match must lie in one of the probed cells.
+
+benchmarks/vector_index.py on one core, 60 faces per search, nlist=1024,
+m=16, int8 refine; p50 latency and recall@1 against exact float32:
+
+    gallery                    exact     nprobe=64 (default)   nprobe=128
+    50k random unit vectors    56 ms     20 ms, 0.98           35 ms, 0.98
+    200k random unit vectors   213 ms    39 ms, 0.95           77 ms, 1.0
+    100k in 2000 clusters      91 ms     37 ms, 1.0            72 ms, 1.0
+    100k in 10000 clusters     97 ms     43 ms, 0.98           93 ms, 1.0
+
+Similarities were within 0.001 of exact throughout. From ~200k students
+nprobe=128 keeps recall near 1. Measure on your own embeddings
+(--embeddings) before choosing nprobe.
+
+The index needs training data. Until train_size students are registered it
+keeps raw float32 vectors and searches them exactly; at that point it
+learns the quantisers in a background thread, from a copy of the vectors and
+without holding the index lock, so searches and registrations carry on, and
+then swaps them in. Students registered later are encoded with the same
+quantisers, so retraining means rebuilding the index from ChromaDB (a
+restart). See benchmarks/vector_index.py for recall against exact search.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from gallery import GalleryIndex, RosterFilter, VectorIndex
+
+# Rows per chunk when assigning vectors to centroids, to bound temporaries.
+_CHUNK = 4096
+# A query stops probing cells once it has this many times the rows of nprobe
+# average cells. On clustered galleries cell sizes vary by 100x or more, and
+# without a cap a face in a crowded region scans several times its share.
+_PROBE_SLACK = 2
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for every row of x."""
+    half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), _CHUNK):
+        block = x[start:start + _CHUNK]
+        out[start:start + _CHUNK] = (block @ centroids.T - half_norms).argmax(axis=1)
+    return out
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), size=len(empty), replace=False)]
+    return centroids
+
+
+def _ragged_arange(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, start + length) for every pair."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int):
+    """Best k (scores, rows) per query row, sorted best-first; rows are -1 where missing."""
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, rows = np.take_along_axis(scores, top, 1), np.take_along_axis(rows, top, 1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    scores, rows = np.take_along_axis(scores, order, 1), np.take_along_axis(rows, order, 1)
+    return scores, np.where(np.isfinite(scores), rows, -1)
+
+
+class IVFPQIndex(VectorIndex):
+    """
+    IVF-PQ gallery with the same upsert_many / search interface as GalleryIndex.
+
+    nlist      — coarse cells; capped at one per 39 training vectors
+    m          — PQ sub-vectors per row (bytes per stored row); must divide dim
+    nprobe     — cells scored per query; higher is slower and more accurate.
+                 Can be changed at any time, or per call to search().
+    train_size — students to collect before training automatically
+                 (default 39 * nlist)
+    refine_dtype — GalleryIndex dtype of the copy the shortlist is re-scored
+                 against ("int8", "float16" or "float32")
+    rerank     — shortlisted candidates re-scored per query (at least top_k)
+    """
+
+    def __init__(self, dim: int = 512, nlist: int = 1024, m: int = 16, nprobe: int = 64,
+                 train_size: int | None = None, refine_dtype: str = "int8", rerank: int = 32,
+                 iterations: int = 10, seed: int = 0):
+        if dim % m:
+            raise ValueError(f"m={m} must divide the embedding dimension {dim}")
+
+        self.dim = dim
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.train_size = train_size if train_size is not None else 39 * nlist
+        self.rerank = rerank
+        self.iterations = iterations
+        self._rng = np.random.default_rng(seed)
+
+        # Learned by train(): (nlist, dim) cell centroids and (m, ksub, dim/m)
+        # sub-vector codebooks.
+        self.centroids = None
+        self.codebooks = None
+        self._half_norms = None
+
+        # Per row: raw vector until trained, then cell id, PQ codes and the
+        # norm of the reconstructed vector.
+        self._raw = np.zeros((0, dim), dtype=np.float32)
+        self._assign = np.zeros(0, dtype=np.int32)
+        self._codes = np.zeros((0, m), dtype=np.uint8)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._rolls: list[str] = []
+        self._metas: list[dict] = []
+        self._row_of: dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Same rows in the same order, for re-scoring.
+        self._refine = GalleryIndex(dim, capacity=0, dtype=refine_dtype)
+
+        # While quantisers are learned off the lock: rows written since the
+        # vectors being encoded were copied.
+        self._training = False
+        self._changed: set[int] = set()
+
+        # Rows sorted by cell, built lazily after each change.
+        self._cells = None
+        self._roster_rows: OrderedDict = OrderedDict()
+        self._max_roster_rows = 8
+
+    # ------------------------------------------------------------------ #
+    #  Loading / Training / Updates                                        #
+    # ------------------------------------------------------------------ #
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 5000, **params) -> "IVFPQIndex":
+        """Build an index from a Chroma collection; training, if due, runs in the background."""
+        index = None
+        for offset in range(0, collection.count(), batch_size):
+            page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if index is None:
+                index = cls(dim=embeddings.shape[1], **params)
+            index.upsert_many(
+                [meta["roll"] for meta in page["metadatas"]],
+                [meta["name"] for meta in page["metadatas"]],
+                embeddings,
+                page["metadatas"],
+            )
+        return index if index is not None else cls(**params)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, samples: np.ndarray | None = None):
+        """
+        Learn the coarse and product quantisers, then encode every stored row.
+
+        samples defaults to the vectors registered so far. Only an untrained
+        index can be trained. The index stays searchable (exactly) and
+        writable throughout; the lock is only taken to copy the vectors and
+        to swap the quantisers in.
+        """
+        with self._lock:
+            if self.is_trained or self._training:
+                raise ValueError("Index is already trained or training; rebuild it to retrain")
+            size = len(self._rolls)
+            x = self._raw[:size].copy() if samples is None else np.asarray(samples, dtype=np.float32).reshape(-1, self.dim)
+            if len(x) == 0:
+                raise ValueError("No vectors to train on")
+            self._training = True
+        try:
+            self._train(x)
+        finally:
+            with self._lock:
+                self._training = False
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        except Exception as exc:
+            print(f"[WARN] IVF-PQ training failed, search stays exact: {exc}")
+
+    def _train(self, x: np.ndarray):
+        started = time.perf_counter()
+        nlist = max(1, min(self.nlist, len(x) // 39))
+        centroids = _kmeans(x, nlist, self.iterations, self._rng)
+        # 64 points per sub-centroid are plenty for the codebooks.
+        sample = x[self._rng.choice(len(x), size=min(len(x), 64 * 256), replace=False)]
+        residuals = sample - centroids[_nearest(sample, centroids)]
+
+        ksub = min(256, len(sample))
+        dsub = self.dim // self.m
+        codebooks = np.empty((self.m, ksub, dsub), dtype=np.float32)
+        for j in range(self.m):
+            codebooks[j] = _kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]),
+                                   ksub, self.iterations, self._rng)
+
+        # Encode what is stored now off the lock too; rows written meanwhile
+        # are tracked in _changed and encoded at the swap.
+        with self._lock:
+            size = len(self._rolls)
+            raw = self._raw[:size].copy()
+            self._changed = set()
+        encoded = self._encode(raw, centroids, codebooks)
+
+        with self._lock:
+            rows = np.array(sorted(self._changed | set(range(size, len(self._rolls)))), dtype=np.int64)
+            self._write_codes(np.arange(size), *encoded)
+            if len(rows):
+                self._write_codes(rows, *self._encode(self._raw[rows], centroids, codebooks))
+            self.nlist, self.centroids, self.codebooks = nlist, centroids, codebooks
+            self._half_norms = 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+            self._raw = None
+            self._changed = set()
+            self._cells = None
+            self._roster_rows.clear()
+        print(f"[OK] IVF-PQ index trained on {len(x)} vectors: {nlist} cells, {self.m} sub-vectors "
+              f"in {time.perf_counter() - started:.1f}s")
+
+    def _encode(self, x: np.ndarray, centroids: np.ndarray | None = None, codebooks: np.ndarray | None = None):
+        """Cell ids, PQ codes and reconstruction norms for rows of x."""
+        centroids = self.centroids if centroids is None else centroids
+        codebooks = self.codebooks if codebooks is None else codebooks
+        assign = _nearest(x, centroids)
+        reconstructed = centroids[assign]
+        residuals = x - reconstructed
+        dsub = self.dim // self.m
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = slice(j * dsub, (j + 1) * dsub)
+            codes[:, j] = _nearest(residuals[:, sub], codebooks[j])
+            reconstructed[:, sub] += codebooks[j][codes[:, j]]
+        norms = np.linalg.norm(reconstructed, axis=1).astype(np.float32)
+        norms[norms == 0] = 1.0
+        return assign.astype(np.int32), codes, norms
+
+    def _write_codes(self, rows: np.ndarray, assign: np.ndarray, codes: np.ndarray, norms: np.ndarray):
+        self._assign[rows], self._codes[rows], self._norms[rows] = assign, codes, norms
+
+    def _grow(self, needed: int):
+        if needed <= len(self._assign):
+            return
+        capacity = max(needed, 2 * len(self._assign), 1024)
+        size = len(self._rolls)
+
+        assign = np.zeros(capacity, dtype=np.int32)
+        codes = np.zeros((capacity, self.m), dtype=np.uint8)
+        norms = np.ones(capacity, dtype=np.float32)
+        assign[:size], codes[:size], norms[:size] = self._assign[:size], self._codes[:size], self._norms[:size]
+        self._assign, self._codes, self._norms = assign, codes, norms
+        if self._raw is not None:
+            raw = np.zeros((capacity, self.dim), dtype=np.float32)
+            raw[:size] = self._raw[:size]
+            self._raw = raw
+
+    def upsert_many(self, rolls: list[str], names: list[str], embeddings: np.ndarray, metadatas: list | None = None):
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        metadatas = metadatas or [{} for _ in rolls]
+
+        with self._lock:
+            trained = self.is_trained
+            if trained:
+                encoded = self._encode(embeddings)
+            self._cells = None
+            self._roster_rows.clear()
+            for i, (roll, name, extra) in enumerate(zip(rolls, names, metadatas)):
+                meta = {**extra, "roll": roll, "name": name}
+                row = self._row_of.get(roll)
+                if row is None:
+                    row = len(self._rolls)
+                    self._grow(row + 1)
+                    self._row_of[roll] = row
+                    self._rolls.append(roll)
+                    self._metas.append(meta)
+                else:
+                    self._metas[row] = meta
+                if trained:
+                    self._write_codes(row, *(part[i] for part in encoded))
+                else:
+                    self._raw[row] = embeddings[i]
+                    if self._training:
+                        self._changed.add(row)
+            self._refine.upsert_many(rolls, names, embeddings, metadatas)
+
+            start_training = not trained and not self._training and len(self._rolls) >= self.train_size
+        if start_training:
+            threading.Thread(target=self._train_in_background, name="ivfpq-train", daemon=True).start()
+
+    # ------------------------------------------------------------------ #
+    #  Search                                                              #
+    # ------------------------------------------------------------------ #
+
+    def __len__(self) -> int:
+        return len(self._rolls)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held for registered rows plus the quantisers."""
+        size = len(self._rolls)
+        refine = self._refine.nbytes
+        if not self.is_trained:
+            return self._raw[:size].nbytes + refine
+        return (self._assign[:size].nbytes + self._codes[:size].nbytes + self._norms[:size].nbytes
+                + self.centroids.nbytes + self.codebooks.nbytes + refine)
+
+    def _lut_offsets(self) -> np.ndarray:
+        # Code j of a row indexes lut[j * ksub + code] in the flattened table.
+        return (np.arange(self.m) * self.codebooks.shape[1]).astype(np.uint32)
+
+    def _cell_layout(self):
+        """
+        Rows regrouped by cell for probing: (rows, cell start offsets, codes, norms).
+
+        The codes are copied in the same order, already offset into the
+        flattened lookup table, so a probed cell is one contiguous slice.
+        Rebuilt on the first search after a change.
+        """
+        if self._cells is None:
+            size = len(self._rolls)
+            order = np.argsort(self._assign[:size], kind="stable")
+            bounds = np.searchsorted(self._assign[order], np.arange(self.nlist + 1))
+            codes = self._codes[order].astype(np.uint32) + self._lut_offsets()
+            self._cells = (order, bounds, codes, self._norms[order])
+        return self._cells
+
+    def _roster_candidates(self, roster: RosterFilter) -> np.ndarray:
+        cached = self._roster_rows.get(roster.key)
+        if cached is not None:
+            self._roster_rows.move_to_end(roster.key)
+            return cached
+
+        if roster.rolls is not None:
+            candidates = [self._row_of[roll] for roll in roster.rolls if roll in self._row_of]
+        else:
+            candidates = range(len(self._rolls))
+        rows = np.array([row for row in candidates if roster.matches(self._metas[row])], dtype=np.int64)
+        self._roster_rows[roster.key] = rows
+        if len(self._roster_rows) > self._max_roster_rows:
+            self._roster_rows.popitem(last=False)
+        return rows
+
+    def _luts(self, queries: np.ndarray) -> np.ndarray:
+        """(N, m * ksub) tables of q_j · codebook_j[c], one flattened row per query."""
+        dsub = self.dim // self.m
+        # (m, N, dsub) @ (m, dsub, ksub): one small matmul per sub-vector.
+        luts = np.matmul(queries.reshape(len(queries), self.m, dsub).transpose(1, 0, 2),
+                         self.codebooks.transpose(0, 2, 1))
+        return np.ascontiguousarray(luts.transpose(1, 0, 2)).reshape(len(queries), -1)
+
+    def _probe(self, queries: np.ndarray, cell_scores: np.ndarray, nprobe: int, keep: int):
+        """
+        Best keep rows per query by PQ score, among the rows of its nprobe best cells.
+
+        Returns (N, keep) scores and rows, padded with -inf / -1. Cells are
+        picked for all queries at once, nearest first, up to _PROBE_SLACK
+        times a balanced share of rows. Each query's candidates are then one
+        gather of codes, one gather from its lookup table and a matrix-vector
+        product to add up the m parts. Only the best keep are kept, so
+        nothing of candidate-list size outlives a query.
+        """
+        order, bounds, cell_codes, cell_norms = self._cell_layout()
+        sizes = np.diff(bounds)
+        nprobe = min(nprobe, int(np.count_nonzero(sizes)))
+        # Rows were assigned to their nearest centroid by L2, so pick cells the
+        # same way: q·c alone favours the long centroids of tight cells.
+        masked = np.where(sizes > 0, cell_scores - self._half_norms, -np.inf)
+        cells = np.argpartition(-masked, nprobe - 1, axis=1)[:, :nprobe]
+        cells = np.take_along_axis(cells, np.argsort(-np.take_along_axis(masked, cells, 1), axis=1), 1)
+        budget = _PROBE_SLACK * nprobe * len(order) / self.nlist
+        probed = np.minimum((np.cumsum(sizes[cells], axis=1) < budget).sum(axis=1) + 1, nprobe)
+        luts = self._luts(queries)
+        ones = np.ones(self.m, dtype=np.float32)
+
+        scores = np.full((len(queries), keep), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), keep), -1, dtype=np.int64)
+        for i in range(len(queries)):
+            query_cells = cells[i, :probed[i]]
+            lengths = sizes[query_cells]
+            positions = _ragged_arange(bounds[query_cells], lengths)
+            partial = luts[i].take(cell_codes[positions]) @ ones
+            partial += np.repeat(cell_scores[i, query_cells], lengths)
+            partial /= cell_norms[positions]
+            if keep < len(partial):
+                best = np.argpartition(-partial, keep - 1)[:keep]
+                partial, positions = partial[best], positions[best]
+            scores[i, :len(partial)] = partial
+            rows[i, :len(partial)] = order[positions]
+        return scores, rows
+
+    def _score_rows(self, queries: np.ndarray, cell_scores: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """(N, len(rows)) PQ scores of the same rows for every query."""
+        luts = self._luts(queries)
+        codes = self._codes[rows].astype(np.uint32) + self._lut_offsets()
+        scores = cell_scores[:, self._assign[rows]]
+        for j in range(self.m):
+            scores += luts[:, codes[:, j]]
+        return scores / self._norms[rows]
+
+    def _rescore(self, queries: np.ndarray, scores: np.ndarray, rows: np.ndarray, keep: int):
+        """The keep best candidates per query by PQ score, re-scored against the refine copy."""
+        if keep < scores.shape[1]:
+            best = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            scores, rows = np.take_along_axis(scores, best, 1), np.take_along_axis(rows, best, 1)
+        refine = self._refine
+        valid = np.isfinite(scores)
+        safe = np.where(valid, rows, 0)
+        exact = np.einsum("nd,nkd->nk", queries, refine._matrix[safe].astype(np.float32))
+        if refine._scales is not None:
+            exact *= refine._scales[safe]
+        return np.where(valid, exact, -np.inf).astype(np.float32), rows
+
+    def search(self, queries: np.ndarray, top_k: int = 1, roster: RosterFilter | None = None,
+               nprobe: int | None = None):
+        """
+        Approximate cosine search for a batch of normalised queries.
+
+        With a roster, every matching student is scored (no cell probing).
+        Rows with fewer than k candidates are padded with -inf and None.
+        Exact over the raw vectors until the index is trained.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = nprobe or self.nprobe
+
+        with self._lock:
+            size = len(self._rolls)
+            metas = self._metas
+            candidates = self._roster_candidates(roster) if roster else None
+            k = min(top_k, size if candidates is None else len(candidates))
+            if k == 0:
+                return np.zeros((len(queries), 0), dtype=np.float32), [[] for _ in queries]
+            if candidates is None and not self.is_trained:
+                candidates = np.arange(size)
+
+            if not self.is_trained:
+                # Too few students to train on yet: exact search over raw rows.
+                scores = queries @ self._raw[candidates].T
+                rows = np.broadcast_to(candidates, scores.shape)
+            else:
+                cell_scores = queries @ self.centroids.T
+                keep = max(k, self.rerank)
+                if candidates is None:
+                    scores, rows = self._probe(queries, cell_scores, nprobe, keep)
+                else:
+                    scores = self._score_rows(queries, cell_scores, candidates)
+                    rows = np.broadcast_to(candidates, scores.shape)
+                scores, rows = self._rescore(queries, scores, rows, keep)
+
+        similarities, top_rows = _top_k(scores, rows, k)
+        if similarities.shape[1] < k:
+            pad = k - similarities.shape[1]
+            similarities = np.pad(similarities, ((0, 0), (0, pad)), constant_values=-np.inf)
+            top_rows = np.pad(top_rows, ((0, 0), (0, pad)), constant_values=-1)
+        metadatas = [[metas[row] if row >= 0 else None for row in row_ids] for row_ids in top_rows]
+        return similarities, metadatas
@@ -0,0 +1,193 @@
+"""
+Background jobs for long-running requests (/detect-and-mark?mode=async).
+
+A big group photo can take longer to process than a client's proxy is willing
+to hold a request open. In async mode the route only enqueues the work and
+returns a job id; JobQueue workers run it in the background and record each
+stage in a JobStore, which clients poll via /jobs/{id} or follow as
+server-sent events.
+
+The store is a local SQLite file so job status and results survive a
+restart. Request payloads (the photo, the caller's Django token) are only
+ever held in memory, so a job cannot outlive the process that accepted it:
+each row records that process's pid, and its unfinished jobs are marked
+failed when it shuts down, when serve.py sees it die, and, for anything
+still left over, at the next startup.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail the job with a client-facing message."""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class JobStore:
+
+    def __init__(self, path: str = "./jobs.db"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id          TEXT PRIMARY KEY,
+                kind        TEXT NOT NULL,
+                status      TEXT NOT NULL,
+                stage       TEXT,
+                created_at  REAL NOT NULL,
+                updated_at  REAL NOT NULL,
+                result      TEXT,
+                error       TEXT,
+                error_code  INTEGER,
+                owner       INTEGER
+            )
+            """
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # Stores created before jobs recorded the process running them.
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def create(self, kind: str) -> str:
+        """Record a queued job owned by this process."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, created_at, updated_at, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, now, now, os.getpid()),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields):
+        """Set any of status, stage, result (JSON-serialisable), error, error_code."""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, stage, created_at, updated_at, result, error, error_code"
+                " FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "stage": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+            "result": json.loads(row[6]) if row[6] is not None else None,
+            "error": row[7],
+            "error_code": row[8],
+        }
+
+    def fail_interrupted(self, owner: int | None = None,
+                         error: str = "Interrupted by a service restart; please resubmit.") -> int:
+        """
+        Fail jobs left queued or running: every one (at startup, before any
+        process has taken new jobs), or only those of process owner.
+        """
+        query = "UPDATE jobs SET status = ?, error = ?, error_code = ?, updated_at = ? WHERE status IN (?, ?)"
+        params = [FAILED, error, 503, time.time(), QUEUED, RUNNING]
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        with self._lock:
+            cursor = self._db.execute(query, params)
+        return cursor.rowcount
+
+    def purge(self, older_than_s: float) -> int:
+        """Delete finished jobs last updated more than older_than_s seconds ago."""
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*FINISHED, time.time() - older_than_s),
+            )
+        return cursor.rowcount
+
+
+class JobQueue:
+    """Bounded in-memory queue of job payloads drained by asyncio worker tasks."""
+
+    def __init__(self, store: JobStore, handler, workers: int = 1, max_pending: int = 32):
+        """
+        handler — async callable(job_id, payload) returning the job result;
+                  raise JobFailed to fail the job with a specific message.
+        """
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers and fail this process's queued and running jobs."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        interrupted = self.store.fail_interrupted(
+            owner=os.getpid(), error="Interrupted by a service shutdown; please resubmit."
+        )
+        if interrupted:
+            print(f"[WARN] Marked {interrupted} unfinished jobs as failed")
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, kind: str, payload) -> str | None:
+        """Create and enqueue a job; returns its id, or None if the queue is full."""
+        if self._queue.full():
+            return None
+        job_id = self.store.create(kind)
+        self._queue.put_nowait((job_id, payload))
+        return job_id
+
+    async def _work(self):
+        while True:
+            job_id, payload = await self._queue.get()
+            self.store.update(job_id, status=RUNNING)
+            try:
+                result = await self.handler(job_id, payload)
+            except JobFailed as exc:
+                self.store.update(job_id, status=FAILED, error=exc.detail, error_code=exc.status_code)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                print(f"[WARN] Job {job_id} failed: {exc}")
+                self.store.update(job_id, status=FAILED, error=str(exc), error_code=500)
+            else:
+                self.store.update(job_id, status=SUCCEEDED, result=result)
+            finally:
+                self._queue.task_done()
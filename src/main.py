@@ -9,11 +9,8 @@ def main():
     orch.register("../photos/chinmay.png", "B22BB001", "Chinmay Vashisth")
     orch.register("../photos/vignesh.png", "B22CS099", "Vignesh Something")
 
-    # Visualize what the model sees in the group photo
-    orch.visualize("../photos/group.png", output_path="detections.jpg")
-
-    # Mark attendance
-    orch.run_pipeline("../photos/group.png")
+    # Mark attendance and save what the model saw in the group photo
+    orch.run_pipeline("../photos/group.png", output_path="detections.jpg")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""
+Minimal Prometheus metrics: counters, gauges and histograms with labels,
+rendered in the text exposition format for a /metrics endpoint.
+
+Hand-rolled rather than pulling in prometheus_client: the service needs only
+these three types. Every update takes one short lock, so metrics can be
+recorded from inference worker threads.
+
+Values live in the memory of one process. Under serve.py each forked worker
+calls Registry.share(directory): a background thread writes the worker's
+values to <directory>/<pid>.json every second, and whichever worker answers
+a scrape renders the sum over every file. Counters and histograms so stay
+monotonic across scrapes (at most a second stale), and a worker that exits
+keeps its last counts. Gauges add up the live workers' values, or take the
+largest for values every worker shares (Gauge(..., merge="max")).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+# Request latencies, seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        """Copy of the current values: {label values tuple: value}."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, snapshots: list) -> dict:
+        """Combine snapshots from several processes; counters add up."""
+        merged = {}
+        for values in snapshots:
+            for key, value in values.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def _samples(self, values: dict):
+        """Yield (suffix, labels dict, value) for every exposed sample."""
+        raise NotImplementedError
+
+    def render(self, values: dict | None = None) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples(self.snapshot() if values is None else values):
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self, values: dict):
+        for key, value in values.items():
+            yield "_total", dict(zip(self.labelnames, key)), value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), fn=None, merge: str = "sum"):
+        """
+        fn    — optional callable returning the current value (or None to skip) at scrape time.
+        merge — how values from several processes combine: "sum" (e.g. queue
+                depths) or "max" (a value every process shares, e.g. gallery size).
+        """
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.mode = merge
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def snapshot(self) -> dict:
+        if self.fn is not None:
+            value = self.fn()
+            return {} if value is None else {(): value}
+        return super().snapshot()
+
+    def merge(self, snapshots: list) -> dict:
+        if self.mode == "sum":
+            return super().merge(snapshots)
+        merged = {}
+        for values in snapshots:
+            for key, value in values.items():
+                merged[key] = max(merged.get(key, value), value)
+        return merged
+
+    def _samples(self, values: dict):
+        for key, value in values.items():
+            yield "", dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum and count.
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    def merge(self, snapshots: list) -> dict:
+        merged = {}
+        for values in snapshots:
+            for key, (counts, total, count) in values.items():
+                entry = merged.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += count
+        return merged
+
+    def _samples(self, values: dict):
+        for key, (counts, total, count) in values.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_bucket", {**labels, "le": "+Inf"}, count
+            yield "_sum", labels, total
+            yield "_count", labels, count
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._directory = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        if self._directory is None:
+            return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+        # Fresh values for this process, the last written ones for the others.
+        self.write()
+        states = []
+        for filename in os.listdir(self._directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._directory, filename)) as f:
+                    states.append((int(filename[:-5]), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        lines = []
+        for metric in self._metrics:
+            snapshots = [
+                {tuple(key): value for key, value in state.get(metric.name, [])}
+                for pid, state in states
+                # A gauge describes the present: skip processes that are gone.
+                if not isinstance(metric, Gauge) or _pid_alive(pid)
+            ]
+            lines.append(metric.render(metric.merge(snapshots)))
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------ #
+    #  Several processes (serve.py)                                        #
+    # ------------------------------------------------------------------ #
+
+    def share(self, directory: str, interval_s: float = 1.0):
+        """Publish this process's values in directory and render every process's total."""
+        self._directory = directory
+        self.write()
+
+        def flush():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    self.write()
+                except Exception as exc:
+                    print(f"[WARN] Could not write metrics to {directory}: {exc}")
+
+        threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+    def write(self):
+        """Write this process's values to <directory>/<pid>.json, atomically."""
+        state = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                 for metric in self._metrics}
+        path = os.path.join(self._directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
@@ -1,4 +1,8 @@
-from face_recognition import FaceAttendanceSystem
+import cv2
+
+from face_recognition import FaceAttendanceSystem, ImageSource, PhotoResult
+from gallery import RosterFilter
+from video import sample_video
 
 
 class AttendanceOrchestrator:
@@ -6,18 +10,54 @@ class AttendanceOrchestrator:
     def __init__(self, **kwargs):
         self.system = FaceAttendanceSystem(**kwargs)
 
-    def register(self, image_path: str, roll: str, name: str) -> bool:
-        return self.system.register_student(image_path, roll, name)
+    def register(self, image: ImageSource, roll: str, name: str,
+                 branch: str | None = None, year: int | None = None,
+                 aligned: bool = False, bbox=None, kps=None) -> bool:
+        return self.system.register_student(
+            image, roll, name, branch=branch, year=year, aligned=aligned, bbox=bbox, kps=kps
+        )
+
+    def register_batch(self, entries: list) -> list:
+        return self.system.register_students(entries)
+
+    def mark(self, group_photo: ImageSource, threshold: float = 0.45, tiled: bool = False,
+             roster: RosterFilter | None = None, progress=None) -> list:
+        return self.system.mark_attendance(group_photo, threshold, tiled=tiled, roster=roster, progress=progress)
+
+    def match_embeddings(self, embeddings, threshold: float = 0.45, roster: RosterFilter | None = None) -> list:
+        return self.system.match_embeddings(embeddings, threshold, roster=roster)
+
+    def mark_annotated(self, group_photo: ImageSource, threshold: float = 0.45, tiled: bool = False,
+                       roster: RosterFilter | None = None, progress=None) -> tuple[list, bytes]:
+        """Attendance plus the photo annotated with roll labels, as JPEG bytes, from one inference."""
+        result = self.system.analyze_photo(
+            group_photo, threshold, tiled=tiled, roster=roster, progress=progress, keep_image=True
+        )
+        ok, jpeg = cv2.imencode(".jpg", self.system.render_detections(result), [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise ValueError("Could not encode annotated image")
+        return result.attendance, jpeg.tobytes()
+
+    def mark_video(self, clip: bytes | None = None, frames: list | None = None,
+                   threshold: float = 0.45, sample_fps: float = 3.0, max_frames: int = 60,
+                   roster: RosterFilter | None = None) -> dict:
+        if clip is not None:
+            frames = sample_video(clip, sample_fps=sample_fps, max_frames=max_frames)
+        else:
+            frames = frames[:max_frames]
+        return self.system.mark_attendance_frames(frames, threshold, roster=roster)
 
-    def mark(self, group_photo_path: str, threshold: float = 0.45) -> list:
-        return self.system.mark_attendance(group_photo_path, threshold)
+    def visualize(self, group_photo: ImageSource, output_path: str = "detections.jpg",
+                  result: PhotoResult | None = None):
+        self.system.visualize_detections(group_photo, output_path, result)
 
-    def visualize(self, group_photo_path: str, output_path: str = "detections.jpg"):
-        self.system.visualize_detections(group_photo_path, output_path)
+    def run_pipeline(self, group_photo: ImageSource, output_path: str | None = None) -> list:
+        """Mark attendance and, with output_path, save the annotated photo — one inference either way."""
+        result = self.system.analyze_photo(group_photo, keep_image=output_path is not None)
+        if output_path is not None:
+            self.visualize(group_photo, output_path, result)
 
-    def run_pipeline(self, group_photo_path: str) -> list:
-        attendance = self.mark(group_photo_path)
         print("\nFinal Attendance List:")
-        for person in attendance:
+        for person in result.attendance:
             print(f"  {person['name']} ({person['roll']})")
-        return attendance
\ No newline at end of file
+        return result.attendance
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+Face quality gate, applied between detection and recognition.
+
+Group photos contain faces that can never clear the match threshold: people
+far in the background, motion-blurred, or turned side-on. Each one still
+costs an alignment and an ArcFace forward pass. QualityGate rejects them
+from what detection already produced, before any embedding:
+
+  det_score — detector confidence below min_det_score
+  size      — shorter box side below min_face_px pixels of the decoded
+              image, i.e. after the MAX_IMAGE_SIDE cap and reduced JPEG
+              decoding, not of the original upload
+  pose      — yaw estimated from the five landmarks above max_yaw_deg
+  blur      — variance of the Laplacian of the face, resampled to 64x64
+              grey, below min_blur
+
+Checks run cheapest first and a face is rejected for the first one it fails.
+A threshold of 0 disables its check.
+"""
+
+import math
+from collections import Counter
+
+import cv2
+import numpy as np
+
+REASONS = ("det_score", "size", "pose", "blur")
+
+# Nose-tip depth in front of the eyes, relative to the distance between them.
+_NOSE_DEPTH = 0.5
+_BLUR_SIDE = 64
+
+
+def estimate_yaw(kps: np.ndarray) -> float:
+    """
+    Rough head yaw in degrees (0 = frontal) from 5-point landmarks.
+
+    Turning the head by θ moves the nose tip sideways from the eyes' midpoint
+    by depth·sin θ while the eye distance shrinks by cos θ, so the nose offset
+    over the eye distance is about _NOSE_DEPTH·tan θ. Measured along the eye
+    line, so in-plane rotation does not count.
+    """
+    left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+    axis = right_eye - left_eye
+    eye_dist = float(np.hypot(*axis))
+    if eye_dist < 1e-6:
+        return 90.0
+    offset = float(np.dot(nose - (left_eye + right_eye) / 2, axis / eye_dist))
+    return abs(math.degrees(math.atan(offset / eye_dist / _NOSE_DEPTH)))
+
+
+def blur_score(img: np.ndarray, bbox) -> float:
+    """Variance of the Laplacian of the face box; low means blurry."""
+    h, w = img.shape[:2]
+    x0, y0 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+    x1, y1 = min(int(math.ceil(bbox[2])), w), min(int(math.ceil(bbox[3])), h)
+    if x1 <= x0 or y1 <= y0:
+        return 0.0
+    grey = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+    grey = cv2.resize(grey, (_BLUR_SIDE, _BLUR_SIDE), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(grey, cv2.CV_32F).var())
+
+
+class QualityGate:
+
+    def __init__(self, min_det_score: float = 0.0, min_face_px: int = 0, max_yaw_deg: float = 0.0,
+                 min_blur: float = 0.0):
+        self.min_det_score = min_det_score
+        self.min_face_px = min_face_px
+        self.max_yaw_deg = max_yaw_deg
+        self.min_blur = min_blur
+
+    def __bool__(self) -> bool:
+        return bool(self.min_det_score or self.min_face_px or self.max_yaw_deg or self.min_blur)
+
+    def check(self, img: np.ndarray, face) -> str | None:
+        """The reason face should not be recognised, or None to keep it."""
+        if self.min_det_score and face.det_score < self.min_det_score:
+            return "det_score"
+        x0, y0, x1, y1 = face.bbox[:4]
+        if self.min_face_px and min(x1 - x0, y1 - y0) < self.min_face_px:
+            return "size"
+        if self.max_yaw_deg and face.kps is not None and estimate_yaw(face.kps) > self.max_yaw_deg:
+            return "pose"
+        if self.min_blur and blur_score(img, face.bbox) < self.min_blur:
+            return "blur"
+        return None
+
+    def split(self, img: np.ndarray, faces: list) -> tuple[list, dict]:
+        """Faces that pass, and {reason: count} for the rest."""
+        kept, skipped = [], Counter()
+        for face in faces:
+            reason = self.check(img, face)
+            if reason is None:
+                kept.append(face)
+            else:
+                skipped[reason] += 1
+        return kept, dict(skipped)
@@ -0,0 +1,90 @@
+"""
+LRU cache of per-photo detection results, keyed by image content.
+
+Organizers often re-upload the same photo after a Django-side failure. The
+expensive part of a request — decode, detection and embedding — depends only
+on the image bytes, so the detected faces' boxes and embeddings are cached
+and a retry (even with a different threshold) only redoes gallery matching.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class CachedDetection:
+
+    def __init__(self, embeddings: np.ndarray, bboxes: np.ndarray, det_scores: np.ndarray,
+                 skipped: dict | None = None):
+        self.embeddings = embeddings
+        self.bboxes = bboxes
+        self.det_scores = det_scores
+        # Faces the quality gate rejected, by reason.
+        self.skipped = skipped or {}
+
+    @property
+    def nbytes(self) -> int:
+        return self.embeddings.nbytes + self.bboxes.nbytes + self.det_scores.nbytes
+
+
+class DetectionCache:
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_s: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, CachedDetection)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key) -> CachedDetection | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, value: CachedDetection):
+        if value.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._bytes += value.nbytes
+
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= value.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+            }
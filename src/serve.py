@@ -0,0 +1,176 @@
+"""
+Multi-process launcher for the face attendance service.
+
+    python serve.py --workers 4 --port 8001
+
+`uvicorn app:app --workers N` starts N independent interpreters. Each one
+loads its own InsightFace models and gallery, so memory grows linearly with
+N, and all of them open the same ChromaDB directory, which is not safe
+across processes. This launcher instead:
+
+  1. loads the models once in the parent, with single-threaded ONNX Runtime
+     sessions (ORT_THREADS=1),
+  2. copies the gallery once into shared memory (see shared_gallery.py),
+  3. forks the workers, which inherit the models copy-on-write and map the
+     same gallery pages, and each serve the app on the shared listening
+     socket,
+  4. keeps the only ChromaDB client in the parent, which applies every
+     registration sent by the workers and broadcasts it back to them.
+
+CPU throughput scales by adding processes (about one per core) rather than
+ORT threads.
+
+ONNX Runtime is not fork-safe once a session has started its intra-op thread
+pool: the child would wait forever on threads that were not copied. With
+ORT_THREADS=1 no pool is created, which is why this launcher sets it. Do not
+raise ORT_THREADS here, and do not warm the models up in the parent.
+
+Workers run INFERENCE_WORKERS threads each (default 1). Each worker keeps its
+own /stats and result cache, and async jobs run in the worker that accepted
+them; the job store is shared. /stats therefore describes one worker,
+whichever answered. /metrics describes the whole server: every worker writes
+its metrics to METRICS_DIR (default: a temporary directory) and the one that
+answers a scrape adds them up (see metrics.py). Needs GALLERY_BACKEND=memory.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import tempfile
+import traceback
+
+import uvicorn
+
+from jobs import JobStore
+from shared_gallery import GalleryWriter, SharedGalleryIndex
+
+
+def _clear_metrics(metrics_dir: str):
+    for filename in os.listdir(metrics_dir):
+        if filename.endswith((".json", ".json.tmp")):
+            os.remove(os.path.join(metrics_dir, filename))
+
+
+def _run_worker(index: int, service, writer: GalleryWriter, sock: socket.socket, metrics_dir: str, log_level: str):
+    service.METRICS.share(metrics_dir)
+    system = service.get_orchestrator().system
+    system.after_fork()
+    # Only the parent may touch ChromaDB; writes go through the writer.
+    system.client = system.collection = None
+
+    def gallery_changed():
+        system.gallery_version += 1
+
+    system.gallery_writer = writer.connect(index, system.gallery, on_apply=gallery_changed)
+    print(f"[INFO] Worker {index} (pid {os.getpid()}) serving")
+    uvicorn.Server(uvicorn.Config(service.app, log_level=log_level)).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8001")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    os.environ.setdefault("ORT_THREADS", "1")
+    if os.getenv("GALLERY_BACKEND", "memory") != "memory":
+        raise SystemExit("serve.py needs GALLERY_BACKEND=memory")
+
+    import app as service
+
+    # Fail jobs from the previous run once, here, not in every worker.
+    store = JobStore(service.JOB_DB_PATH)
+    interrupted = store.fail_interrupted()
+    if interrupted:
+        print(f"[WARN] Marked {interrupted} interrupted jobs as failed")
+    store.purge(service.JOB_RETENTION_H * 3600)
+    store.close()
+    service.RECOVER_INTERRUPTED_JOBS = False
+
+    metrics_dir = os.getenv("METRICS_DIR") or tempfile.mkdtemp(prefix="face-metrics-")
+    os.makedirs(metrics_dir, exist_ok=True)
+    _clear_metrics(metrics_dir)  # counts of a previous run must not add to this one's
+
+    system = service.get_orchestrator().system
+    # A snapshot-loaded gallery is reconciled with ChromaDB in a background
+    # thread; finish that before copying the gallery and forking.
+    system.wait_for_store()
+    system.gallery = SharedGalleryIndex.from_index(system.gallery)
+    writer = GalleryWriter(system, args.workers)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    print(f"[INFO] Listening on {args.host}:{args.port} with {args.workers} workers")
+
+    children = {}
+    for index in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(index, service, writer, sock, metrics_dir, args.log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    # Threads only after the last fork.
+    writer.start()
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        # SIGINT from a terminal already reached the whole process group.
+        if signum == signal.SIGTERM:
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    exit_code = 0
+    while children:
+        pid, status = os.wait()
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        # A worker that shut down cleanly has already failed its own jobs;
+        # one that crashed or was killed left them queued or running.
+        store = JobStore(service.JOB_DB_PATH)
+        lost = store.fail_interrupted(
+            owner=pid, error=f"Worker {index} exited before the job finished; please resubmit."
+        )
+        store.close()
+        if lost:
+            print(f"[WARN] Marked {lost} jobs of worker {index} as failed")
+        if not stopping:
+            # Workers are not respawned: forking again from a parent that now
+            # runs threads is unsafe. Stop everything and let the supervisor
+            # restart the service.
+            print(f"[WARN] Worker {index} exited unexpectedly (status {status}); shutting down")
+            stopping, exit_code = True, 1
+            for other in children:
+                os.kill(other, signal.SIGTERM)
+
+    writer.stop()
+    system.close()  # saves the gallery snapshot, so before unlink
+    system.gallery.unlink()
+    _clear_metrics(metrics_dir)
+    if not os.getenv("METRICS_DIR"):
+        os.rmdir(metrics_dir)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Gallery matrix in shared memory, with one writer, for multi-process serving.
+
+serve.py forks several worker processes from one parent. Each worker would
+otherwise hold its own copy of the gallery matrix, and ChromaDB's
+PersistentClient must not be opened from several processes at once. So:
+
+  - The parent keeps the only ChromaDB client and a SharedGalleryIndex whose
+    matrix lives in a POSIX shared-memory segment. Workers inherit the
+    mapping when they are forked and score against the same physical pages.
+  - Workers never write. /register and /register-batch still compute
+    embeddings in the worker, then hand them to the parent through a
+    GalleryWriter queue; the parent upserts ChromaDB and the shared matrix.
+  - After every write the parent broadcasts the changed rows' roll/metadata
+    (and, if the matrix had to grow, the new segment's name) to every
+    worker, which applies it to its own row table before the register call
+    returns.
+  - A grow leaves the old segment linked until every worker has applied a
+    version at or past the grow, so a worker that is several changes behind
+    can still attach to the segment each change names. Should attaching fail
+    anyway, the worker maps the writer's current segment instead.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gallery import GalleryIndex
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Map an existing segment without making this process responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every mapping with the resource tracker.
+        # Forked workers share the parent's tracker, where the name is
+        # already registered, so this is a no-op.
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedGalleryIndex(GalleryIndex):
+    """
+    GalleryIndex whose matrix (and int8 scales) live in a shared-memory segment.
+
+    The process that creates it is the writer: upsert_many reports every
+    change to on_change. Readers (forked workers) only ever call apply().
+    """
+
+    def __init__(self, dim: int = 512, capacity: int = 1024, dtype: str = "float32", block_rows: int = 1024):
+        self._segment = None
+        # Replaced segments not yet closed here (views may still exist), and,
+        # in the writer, closed ones kept linked as (grow version, segment)
+        # until every reader is past that version.
+        self._pending_close = []
+        self._retired = []
+        self.version = 0
+        self.on_change = None
+        self._applied = threading.Condition()
+        super().__init__(dim, capacity, dtype, block_rows)
+
+    @classmethod
+    def from_index(cls, index: GalleryIndex) -> "SharedGalleryIndex":
+        """Copy an in-process GalleryIndex into shared memory."""
+        shared = cls(dim=index.dim, capacity=max(len(index), 1024), dtype=index.dtype, block_rows=index.block_rows)
+        size = len(index)
+        shared._matrix[:size] = index._matrix[:size]
+        if shared._scales is not None:
+            shared._scales[:size] = index._scales[:size]
+        shared._rolls = list(index._rolls)
+        shared._metas = list(index._metas)
+        shared._row_of = dict(index._row_of)
+        return shared
+
+    def _layout(self, capacity: int):
+        itemsize = np.dtype(self.dtype).itemsize
+        matrix_bytes = capacity * self.dim * itemsize
+        scale_bytes = capacity * 4 if self.dtype == "int8" else 0
+        return matrix_bytes, matrix_bytes + scale_bytes
+
+    def _map(self, segment: shared_memory.SharedMemory, capacity: int):
+        matrix_bytes, _ = self._layout(capacity)
+        matrix = np.ndarray((capacity, self.dim), dtype=np.dtype(self.dtype), buffer=segment.buf)
+        scales = None
+        if self.dtype == "int8":
+            scales = np.ndarray(capacity, dtype=np.float32, buffer=segment.buf, offset=matrix_bytes)
+        return matrix, scales
+
+    def _allocate(self, capacity: int):
+        # A fresh segment is zero-filled by the OS.
+        segment = shared_memory.SharedMemory(create=True, size=max(self._layout(capacity)[1], 1))
+        self._retire(segment)
+        return self._map(segment, capacity)
+
+    def _retire(self, segment: shared_memory.SharedMemory):
+        """Switch to a new segment; the old mapping is released once nothing views it."""
+        old, self._segment = self._segment, segment
+        if old is not None:
+            self._pending_close.append(old)
+
+    def _close_old(self) -> list:
+        """Close replaced mappings that nothing views any more and return them."""
+        closed, pending = [], []
+        for old in self._pending_close:
+            try:
+                old.close()
+                closed.append(old)
+            except BufferError:
+                # A search that started before the swap still holds a view.
+                pending.append(old)
+        self._pending_close = pending
+        return closed
+
+    # ------------------------------------------------------------------ #
+    #  Writer                                                              #
+    # ------------------------------------------------------------------ #
+
+    def upsert_many(self, rolls: list[str], names: list[str], embeddings: np.ndarray, metadatas: list | None = None):
+        super().upsert_many(rolls, names, embeddings, metadatas)
+        with self._lock:
+            self.version += 1
+            # Readers behind this version may still attach to these.
+            self._retired += [(self.version, old) for old in self._close_old()]
+            change = {
+                "version": self.version,
+                "segment": self._segment.name,
+                "capacity": len(self._matrix),
+                "rows": [(self._row_of[roll], roll, self._metas[self._row_of[roll]]) for roll in dict.fromkeys(rolls)],
+            }
+        if self.on_change is not None:
+            self.on_change(change)
+
+    def release_retired(self, applied: int):
+        """Unlink segments replaced at or before version applied, which every reader has reached."""
+        with self._lock:
+            keep = []
+            for version, old in self._retired:
+                if version <= applied:
+                    old.unlink()
+                else:
+                    keep.append((version, old))
+            self._retired = keep
+
+    def unlink(self):
+        """Free the segment; call in the writer once every reader has exited."""
+        with self._lock:
+            self._matrix = self._scales = None
+            self._roster_slices.clear()
+            self._close_old()
+            for old in self._pending_close:
+                old.unlink()
+            self._segment.close()
+            self._segment.unlink()
+        self.release_retired(self.version)
+
+    # ------------------------------------------------------------------ #
+    #  Reader                                                              #
+    # ------------------------------------------------------------------ #
+
+    def apply(self, change: dict, on_apply=None, current=None):
+        """
+        Apply a change broadcast by the writer's upsert_many.
+
+        current, if given, returns the writer's (segment name, capacity) and
+        is used when the segment named in the change cannot be attached.
+        on_apply is called before waiters in wait_for are released.
+        """
+        with self._lock:
+            if change["segment"] != self._segment.name:
+                try:
+                    segment, capacity = _attach(change["segment"]), change["capacity"]
+                except FileNotFoundError:
+                    if current is None:
+                        raise
+                    name, capacity = current()
+                    print(f"[WARN] Gallery segment {change['segment']} is gone; resyncing from {name}")
+                    # Already mapped if an earlier change resynced to it.
+                    segment = _attach(name) if name != self._segment.name else None
+                if segment is not None:
+                    self._retire(segment)
+                    self._matrix, self._scales = self._map(self._segment, capacity)
+                    self._close_old()
+
+            for row, roll, meta in change["rows"]:
+                if row == len(self._rolls):
+                    self._rolls.append(roll)
+                    self._metas.append(meta)
+                    self._row_of[roll] = row
+                else:
+                    self._metas[row] = meta
+            self._roster_slices.clear()
+
+        if on_apply is not None:
+            on_apply()
+        with self._applied:
+            self.version = change["version"]
+            self._applied.notify_all()
+
+    def wait_for(self, version: int, timeout: float = 30.0) -> bool:
+        """Block until changes up to version have been applied here."""
+        with self._applied:
+            return self._applied.wait_for(lambda: self.version >= version, timeout)
+
+
+class GalleryWriter:
+    """
+    The parent's side of the single-writer protocol.
+
+    Created before the workers are forked; each worker then calls
+    connect(worker_index) to get the callable its FaceAttendanceSystem uses
+    in place of writing ChromaDB itself.
+    """
+
+    def __init__(self, system, workers: int):
+        self.system = system
+        self._requests = multiprocessing.Queue()
+        self._replies = [multiprocessing.Queue() for _ in range(workers)]
+        self._broadcasts = [multiprocessing.Queue() for _ in range(workers)]
+        # Version each worker has applied, and the writer's current
+        # "segment:capacity", both in shared memory inherited by the workers.
+        self._applied = multiprocessing.Array("q", [system.gallery.version] * workers)
+        self._current = multiprocessing.Array("c", 128)
+        self._thread = None
+        self._publish(system.gallery)
+        system.gallery.on_change = self._broadcast
+
+    def start(self):
+        """Start serving write requests. Call in the parent after forking the workers."""
+        self._thread = threading.Thread(target=self._serve, name="gallery-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _publish(self, gallery: SharedGalleryIndex):
+        with self._current.get_lock():
+            self._current.value = f"{gallery._segment.name}:{len(gallery._matrix)}".encode()
+
+    def _current_segment(self) -> tuple[str, int]:
+        with self._current.get_lock():
+            name, capacity = self._current.value.decode().rsplit(":", 1)
+        return name, int(capacity)
+
+    def _broadcast(self, change: dict):
+        self._publish(self.system.gallery)
+        for broadcasts in self._broadcasts:
+            broadcasts.put(change)
+        self.release_retired()
+
+    def release_retired(self):
+        """Unlink replaced segments once every worker has moved past them."""
+        with self._applied.get_lock():
+            applied = min(self._applied[:])
+        self.system.gallery.release_retired(applied)
+
+    def _serve(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            worker, request_id, rolls, names, embeddings, extras = request
+            try:
+                self.system._upsert_students(rolls, names, embeddings, extras)
+                reply = (request_id, True, self.system.gallery.version)
+            except Exception as exc:
+                print(f"[WARN] Gallery write from worker {worker} failed: {exc}")
+                reply = (request_id, False, str(exc))
+            self._replies[worker].put(reply)
+
+    def connect(self, worker: int, gallery: SharedGalleryIndex, on_apply=None) -> "RemoteGalleryWriter":
+        """Worker side: start applying broadcasts and return the write callable."""
+        gallery.on_change = None
+        client = RemoteGalleryWriter(worker, self._requests, self._replies[worker], gallery)
+        threading.Thread(
+            target=client._listen,
+            args=(self._broadcasts[worker], on_apply, self._applied, self._current_segment),
+            name="gallery-reader",
+            daemon=True,
+        ).start()
+        return client
+
+
+class RemoteGalleryWriter:
+    """Callable a worker's FaceAttendanceSystem uses to write through the parent."""
+
+    def __init__(self, worker: int, requests, replies, gallery: SharedGalleryIndex, timeout: float = 60.0):
+        self.worker = worker
+        self.gallery = gallery
+        self.timeout = timeout
+        self._requests = requests
+        self._replies = replies
+        # One outstanding write per worker. Requests are numbered and the
+        # parent echoes the number, so the late reply to a write that timed
+        # out is recognised and dropped instead of answering the next one.
+        self._lock = threading.Lock()
+        self._request_id = 0
+
+    def __call__(self, rolls: list[str], names: list[str], embeddings: np.ndarray, extras: list | None = None):
+        with self._lock:
+            self._request_id += 1
+            request_id = self._request_id
+            self._requests.put((self.worker, request_id, list(rolls), list(names), np.asarray(embeddings), extras))
+            ok, value = self._reply(request_id)
+        if not ok:
+            raise RuntimeError(f"Gallery write failed: {value}")
+        # Make this worker's own next search see the new students.
+        if not self.gallery.wait_for(value, self.timeout):
+            raise RuntimeError(
+                f"Gallery write was stored but not applied in worker {self.worker} within {self.timeout}s"
+            )
+
+    def _reply(self, request_id: int):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                reply_id, ok, value = self._replies.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Gallery write timed out after {self.timeout}s in worker {self.worker}; "
+                    "the parent may still apply it"
+                ) from None
+            if reply_id == request_id:
+                return ok, value
+            print(f"[WARN] Worker {self.worker} dropped a late reply to gallery write {reply_id}")
+
+    def _listen(self, broadcasts, on_apply, applied, current):
+        while True:
+            change = broadcasts.get()
+            # apply() changes nothing until the segment is mapped, so a failed
+            # change is retried as is; later ones depend on it.
+            delay = 0.1
+            while True:
+                try:
+                    self.gallery.apply(change, on_apply, current)
+                    break
+                except Exception:
+                    print(f"[WARN] Worker {self.worker} could not apply gallery version {change['version']}; retrying")
+                    traceback.print_exc()
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+            with applied.get_lock():
+                applied[self.worker] = self.gallery.version
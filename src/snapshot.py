@@ -0,0 +1,267 @@
+"""
+Memory-mapped gallery snapshots for fast cold starts.
+
+Loading the gallery from ChromaDB means opening the persistent store and
+paging every embedding out of it, which grows with the number of students.
+A snapshot is the in-memory gallery written to a directory as:
+
+  embeddings.npy — the (N, D) matrix in the gallery's dtype
+  scales.npy     — per-row dequantisation scales (int8 galleries only)
+  rows.json      — one {"roll", "name", ...} metadata dict per row
+  manifest.json  — format, dtype, row count, a content version stamp and a
+                   checksum per file
+
+At startup FaceAttendanceSystem maps embeddings.npy copy-on-write, so
+matching works as soon as the file is opened, and reconciles with ChromaDB
+in a background thread (see reconcile). Files are written under temporary
+names and renamed into place, manifest last, so a reader never sees a
+half-written snapshot.
+
+CLI, run from src/:
+
+    python snapshot.py build  --db-path ./attendance_db --out ./gallery_snapshot
+    python snapshot.py verify --db-path ./attendance_db --snapshot ./gallery_snapshot
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from gallery import DTYPES, GalleryIndex
+
+FORMAT = 1
+_FILES = ("embeddings.npy", "scales.npy", "rows.json")
+
+
+def _digest_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _content_version(metas: list, matrix: np.ndarray, scales: np.ndarray | None) -> str:
+    """Stamp that changes whenever any roll, metadata or vector changes."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(metas, sort_keys=True).encode())
+    digest.update(np.ascontiguousarray(matrix).data)
+    if scales is not None:
+        digest.update(np.ascontiguousarray(scales).data)
+    return digest.hexdigest()
+
+
+def write_snapshot(index: GalleryIndex, path: str) -> dict:
+    """Write the gallery to path and return its manifest."""
+    os.makedirs(path, exist_ok=True)
+    with index._lock:
+        size = len(index)
+        matrix = np.array(index._matrix[:size])
+        scales = np.array(index._scales[:size]) if index._scales is not None else None
+        metas = list(index._metas)
+
+    staged = {"embeddings.npy": matrix, "rows.json": metas}
+    if scales is not None:
+        staged["scales.npy"] = scales
+
+    checksums = {}
+    for name, content in staged.items():
+        tmp = os.path.join(path, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            if name.endswith(".npy"):
+                np.save(f, content)
+            else:
+                f.write(json.dumps(content).encode())
+        checksums[name] = _digest_file(tmp)
+        os.replace(tmp, os.path.join(path, name))
+    if scales is None and os.path.exists(os.path.join(path, "scales.npy")):
+        os.remove(os.path.join(path, "scales.npy"))
+
+    manifest = {
+        "format": FORMAT,
+        "version": _content_version(metas, matrix, scales),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "count": len(metas),
+        "dim": index.dim,
+        "dtype": index.dtype,
+        "files": checksums,
+    }
+    tmp = os.path.join(path, ".manifest.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(path, "manifest.json"))
+    return manifest
+
+
+def read_manifest(path: str) -> dict | None:
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return manifest if manifest.get("format") == FORMAT else None
+
+
+def load_snapshot(path: str, dtype: str | None = None):
+    """
+    Map a snapshot as a GalleryIndex.
+
+    Returns (index, manifest), or None if there is no usable snapshot at path
+    or it was written with a different dtype. The matrix is mapped
+    copy-on-write: pages are read on first use and registrations after
+    startup never touch the file.
+    """
+    manifest = read_manifest(path)
+    if manifest is None or (dtype is not None and manifest["dtype"] != dtype):
+        return None
+    try:
+        matrix = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="c")
+        scales = None
+        if manifest["dtype"] == "int8":
+            scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="c")
+        with open(os.path.join(path, "rows.json")) as f:
+            metas = json.load(f)
+    except (OSError, ValueError) as exc:
+        print(f"[WARN] Ignoring unreadable gallery snapshot at {path}: {exc}")
+        return None
+    if len(metas) != len(matrix) or len(metas) != manifest["count"]:
+        print(f"[WARN] Ignoring inconsistent gallery snapshot at {path}")
+        return None
+    return GalleryIndex.from_arrays(matrix, metas, scales), manifest
+
+
+def reconcile(index: GalleryIndex, collection, batch_size: int = 5000, apply: bool = True) -> dict:
+    """
+    Compare a gallery with the ChromaDB collection it mirrors.
+
+    Students added or changed in ChromaDB are upserted into the index when
+    apply is set. Students in the index but gone from ChromaDB are only
+    reported: the index cannot delete rows, so the caller rebuilds it.
+
+    Returns {"added", "changed", "removed", "removed_rolls"}.
+    """
+    added = changed = 0
+    seen = set()
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        page = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        encoded, encoded_scales = index._encode(embeddings)
+
+        stale = []
+        for i, meta in enumerate(page["metadatas"]):
+            roll = meta["roll"]
+            seen.add(roll)
+            row = index._row_of.get(roll)
+            if row is None:
+                added += 1
+                stale.append(i)
+            elif (
+                index._metas[row] != {**meta}
+                or not np.array_equal(index._matrix[row], encoded[i])
+                or (encoded_scales is not None and index._scales[row] != encoded_scales[i])
+            ):
+                changed += 1
+                stale.append(i)
+
+        if apply and stale:
+            metas = [page["metadatas"][i] for i in stale]
+            index.upsert_many(
+                [meta["roll"] for meta in metas],
+                [meta["name"] for meta in metas],
+                embeddings[stale],
+                metas,
+            )
+
+    removed = [roll for roll in index._rolls if roll not in seen]
+    return {"added": added, "changed": changed, "removed": len(removed), "removed_rolls": removed}
+
+
+def _verify_files(path: str, manifest: dict) -> list[str]:
+    problems = []
+    for name in _FILES:
+        expected = manifest["files"].get(name)
+        file_path = os.path.join(path, name)
+        if expected is None:
+            continue
+        if not os.path.exists(file_path):
+            problems.append(f"{name} is missing")
+        elif _digest_file(file_path) != expected:
+            problems.append(f"{name} does not match its checksum")
+    return problems
+
+
+def _open_collection(db_path: str, name: str):
+    """The existing ChromaDB collection; never create one, which would lose the cosine space."""
+    import chromadb
+
+    try:
+        return chromadb.PersistentClient(path=db_path).get_collection(name=name)
+    except Exception as exc:
+        # NotFoundError, or ValueError on older chromadb releases.
+        sys.exit(f"[ERROR] No collection {name!r} in {db_path}: {exc}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="write a snapshot of the ChromaDB gallery")
+    build.add_argument("--db-path", default="./attendance_db")
+    build.add_argument("--collection", default="students")
+    build.add_argument("--out", default="./gallery_snapshot")
+    build.add_argument("--dtype", choices=DTYPES, default="float32")
+
+    verify = commands.add_parser("verify", help="check a snapshot's files and compare it with ChromaDB")
+    verify.add_argument("--db-path", default="./attendance_db")
+    verify.add_argument("--collection", default="students")
+    verify.add_argument("--snapshot", default="./gallery_snapshot")
+    verify.add_argument("--no-db", action="store_true", help="only check the files against the manifest")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        collection = _open_collection(args.db_path, args.collection)
+        index = GalleryIndex.from_collection(collection, dtype=args.dtype)
+        manifest = write_snapshot(index, args.out)
+        print(f"[OK] Wrote {manifest['count']} students ({args.dtype}) to {args.out} "
+              f"in {time.perf_counter() - started:.2f}s, version {manifest['version']}")
+        return
+
+    manifest = read_manifest(args.snapshot)
+    if manifest is None:
+        sys.exit(f"[ERROR] No snapshot at {args.snapshot}")
+    problems = _verify_files(args.snapshot, manifest)
+
+    loaded = load_snapshot(args.snapshot)
+    if loaded is None:
+        problems.append("snapshot could not be loaded")
+    elif _content_version(loaded[0]._metas, loaded[0]._matrix, loaded[0]._scales) != manifest["version"]:
+        problems.append("content does not match the manifest version")
+
+    if loaded is not None and not args.no_db:
+        collection = _open_collection(args.db_path, args.collection)
+        diff = reconcile(loaded[0], collection, apply=False)
+        if diff["added"] or diff["changed"] or diff["removed"]:
+            problems.append(
+                f"out of date with ChromaDB: {diff['added']} added, {diff['changed']} changed, "
+                f"{diff['removed']} removed since the snapshot"
+            )
+
+    print(f"Snapshot {args.snapshot}: {manifest['count']} students, {manifest['dtype']}, "
+          f"version {manifest['version']}, created {manifest['created_at']}")
+    if problems:
+        for problem in problems:
+            print(f"[FAIL] {problem}")
+        sys.exit(1)
+    print("[OK] Snapshot is valid")
+
+
+if __name__ == "__main__":
+    main()
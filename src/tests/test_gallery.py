@@ -0,0 +1,48 @@
+import threading
+
+import numpy as np
+
+from gallery import GalleryIndex, RosterFilter
+
+
+def _unit(rows):
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_scoring_runs_outside_the_lock():
+    index = GalleryIndex(dim=8, capacity=4)
+    index.upsert_many(["R1", "R2"], ["a", "b"], np.eye(8)[:2], [{"year": 1}, {"year": 2}])
+    held = []
+    score = index._scores
+
+    def spy(*args):
+        held.append(index._lock.locked())
+        return score(*args)
+
+    index._scores = spy
+    index.search(np.eye(8)[:1])
+    index.search(np.eye(8)[:1], roster=RosterFilter(year=2))
+    assert held == [False, False]
+
+
+def test_search_while_the_gallery_grows():
+    rng = np.random.default_rng(0)
+    gallery = _unit(rng.standard_normal((2000, 32)))
+    index = GalleryIndex(dim=32, capacity=1)
+    index.upsert_many(["R0"], ["R0"], gallery[:1])
+    errors = []
+
+    def search():
+        for _ in range(200):
+            similarities, metadatas = index.search(gallery[:1], top_k=1)
+            if metadatas[0][0]["roll"] != "R0" or abs(similarities[0, 0] - 1.0) > 1e-5:
+                errors.append((metadatas[0][0], similarities[0, 0]))
+
+    reader = threading.Thread(target=search)
+    reader.start()
+    for start in range(1, len(gallery), 50):
+        rolls = [f"R{i}" for i in range(start, min(start + 50, len(gallery)))]
+        index.upsert_many(rolls, rolls, gallery[start:start + 50])
+    reader.join()
+    assert errors == []
+    assert len(index) == len(gallery)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sqlite3
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobStore
+
+
+def test_startup_fails_jobs_left_running(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    store = JobStore(path)
+    running, done = store.create("detect"), store.create("detect")
+    store.update(running, status=RUNNING, stage="detect")
+    store.update(done, status=SUCCEEDED, result={"ok": True})
+    store.close()
+
+    # A new process opening the same file after a crash.
+    store = JobStore(path)
+    assert store.fail_interrupted() == 1
+    job = store.get(running)
+    assert job["status"] == FAILED and job["error_code"] == 503
+    assert store.get(done)["status"] == SUCCEEDED
+
+
+def test_only_the_dead_workers_jobs_are_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    mine = store.create("detect")
+    theirs = store.create("detect")
+    store._db.execute("UPDATE jobs SET owner = ?, status = ? WHERE id = ?", (os.getpid() + 1, RUNNING, theirs))
+
+    assert store.fail_interrupted(owner=os.getpid() + 1) == 1
+    assert store.get(theirs)["status"] == FAILED
+    assert store.get(mine)["status"] == QUEUED
+
+
+def test_stopping_the_queue_fails_its_unfinished_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+
+    async def handler(job_id, payload):
+        await asyncio.sleep(60)
+
+    async def run():
+        queue = JobQueue(store, handler, workers=1)
+        queue.start()
+        running, queued = queue.submit("detect", None), queue.submit("detect", None)
+        await asyncio.sleep(0.05)
+        assert store.get(running)["status"] == RUNNING
+        await queue.stop()
+        return running, queued
+
+    for job_id in asyncio.run(run()):
+        assert store.get(job_id)["status"] == FAILED
+
+
+def test_old_store_gains_the_owner_column(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT,"
+        " created_at REAL NOT NULL, updated_at REAL NOT NULL, result TEXT, error TEXT, error_code INTEGER)"
+    )
+    db.close()
+
+    store = JobStore(path)
+    job_id = store.create("detect")
+    assert store.fail_interrupted(owner=os.getpid()) == 1
+    assert store.get(job_id)["status"] == FAILED
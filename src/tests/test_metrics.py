@@ -0,0 +1,68 @@
+import os
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def _registry():
+    registry = Registry()
+    hits = registry.register(Counter("hits", "Hits.", ("route",)))
+    depth = registry.register(Gauge("depth", "Depth."))
+    size = registry.register(Gauge("size", "Size.", merge="max"))
+    seconds = registry.register(Histogram("seconds", "Seconds.", buckets=(1.0, 2.0)))
+    return registry, hits, depth, size, seconds
+
+
+def test_shared_registries_render_the_sum(tmp_path):
+    registry, hits, depth, size, seconds = _registry()
+
+    # A worker that served requests and then exited.
+    pid = os.fork()
+    if pid == 0:
+        try:
+            registry._directory = str(tmp_path)
+            hits.inc(2, route="/a")
+            depth.set(5)
+            size.set(7)
+            seconds.observe(1.5)
+            registry.write()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    registry.share(str(tmp_path))
+    hits.inc(route="/a")
+    hits.inc(route="/b")
+    depth.set(3)
+    size.set(4)
+    seconds.observe(0.5)
+    text = registry.render()
+
+    # Counts of the exited worker are kept, its gauges are not.
+    assert 'hits_total{route="/a"} 3' in text
+    assert 'hits_total{route="/b"} 1' in text
+    assert "depth 3" in text
+    assert "size 4" in text
+    assert 'seconds_bucket{le="1"} 1' in text
+    assert 'seconds_bucket{le="2"} 2' in text
+    assert "seconds_count 2" in text
+    assert "seconds_sum 2" in text
+
+
+def test_live_gauges_combine_by_mode(tmp_path, monkeypatch):
+    first, _, depth, size, _ = _registry()
+    second, _, other_depth, other_size, _ = _registry()
+    first.share(str(tmp_path))
+    depth.set(1)
+    size.set(10)
+
+    # Same process, written under another live pid (the parent's).
+    second._directory = str(tmp_path)
+    other_depth.set(2)
+    other_size.set(12)
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "getpid", os.getppid)
+        second.write()
+
+    text = first.render()
+    assert "depth 3" in text
+    assert "size 12" in text
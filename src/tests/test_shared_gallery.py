@@ -0,0 +1,126 @@
+import multiprocessing
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from shared_gallery import GalleryWriter, RemoteGalleryWriter, SharedGalleryIndex
+
+DIM = 8
+
+
+def _unit(rows: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((rows, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _register(gallery: SharedGalleryIndex, start: int, count: int):
+    rolls = [f"R{i:03d}" for i in range(start, start + count)]
+    gallery.upsert_many(rolls, rolls, _unit(count, seed=start))
+
+
+def _lagging_reader(writer: GalleryWriter, gallery: SharedGalleryIndex, go, results):
+    # Starts listening only after the writer has grown the matrix three times.
+    go.wait(30)
+    writer.connect(0, gallery)
+    if not gallery.wait_for(3, timeout=30):
+        results.put(("not applied", gallery.version))
+        return
+    while writer._applied[0] < 3:
+        time.sleep(0.01)
+    similarities, metadatas = gallery.search(_unit(12, seed=16)[-1:])
+    results.put((metadatas[0][0]["roll"], round(float(similarities[0, 0]), 4), len(gallery)))
+
+
+def test_reader_behind_several_grows_catches_up():
+    ctx = multiprocessing.get_context("fork")
+    gallery = SharedGalleryIndex(dim=DIM, capacity=4)
+    writer = GalleryWriter(SimpleNamespace(gallery=gallery), workers=1)
+    go, results = ctx.Event(), ctx.Queue()
+
+    reader = ctx.Process(target=_lagging_reader, args=(writer, gallery, go, results))
+    reader.start()
+    try:
+        # Capacity 4 -> 8 -> 16 -> 32: each write moves to a new segment.
+        _register(gallery, 0, 8)
+        _register(gallery, 8, 8)
+        _register(gallery, 16, 12)
+        assert len(gallery._retired) == 3
+        go.set()
+        assert results.get(timeout=30) == ("R027", 1.0, 28)
+
+        # The reader is past every grow, so the next write frees them.
+        _register(gallery, 28, 1)
+        assert gallery._retired == []
+    finally:
+        reader.join(10)
+        if reader.is_alive():
+            reader.terminate()
+        gallery.unlink()
+
+
+def test_reader_resyncs_when_segment_is_gone():
+    writer = SharedGalleryIndex(dim=DIM, capacity=2)
+    reader = SharedGalleryIndex.from_index(writer)
+    own_segment = reader._segment
+    changes = []
+    writer.on_change = changes.append
+    try:
+        _register(writer, 0, 4)
+        _register(writer, 4, 4)
+        # Free the segment the first change names while the reader is behind.
+        writer.release_retired(writer.version)
+
+        current = lambda: (writer._segment.name, len(writer._matrix))
+        for change in changes:
+            reader.apply(change, current=current)
+
+        assert reader.version == 2 and len(reader) == 8
+        _, metadatas = reader.search(_unit(4, seed=4)[:1])
+        assert metadatas[0][0]["roll"] == "R004"
+    finally:
+        reader._matrix = reader._scales = None
+        reader._close_old()
+        reader._segment.close()
+        own_segment.unlink()
+        writer.unlink()
+
+
+def test_write_fails_when_worker_never_applies_it():
+    gallery = SharedGalleryIndex(dim=DIM, capacity=2)
+    replies = queue.Queue()
+    replies.put((1, True, 5))
+    client = RemoteGalleryWriter(0, queue.Queue(), replies, gallery, timeout=0.1)
+    try:
+        with pytest.raises(RuntimeError, match="not applied"):
+            client(["R000"], ["R000"], _unit(1, seed=0))
+    finally:
+        gallery.unlink()
+
+
+def test_late_reply_is_not_taken_for_the_next_write():
+    gallery = SharedGalleryIndex(dim=DIM, capacity=2)
+    requests, replies = queue.Queue(), queue.Queue()
+    client = RemoteGalleryWriter(0, requests, replies, gallery, timeout=0.2)
+    gallery.version = 2
+
+    def slow_writer():
+        # The first write is answered after the worker gave up on it; the
+        # second one fails.
+        first, second = requests.get(), requests.get()
+        replies.put((first[1], True, 1))
+        replies.put((second[1], False, "duplicate roll"))
+
+    writer = threading.Thread(target=slow_writer, daemon=True)
+    writer.start()
+    try:
+        with pytest.raises(RuntimeError, match="timed out"):
+            client(["R000"], ["R000"], _unit(1, seed=0))
+        with pytest.raises(RuntimeError, match="duplicate roll"):
+            client(["R001"], ["R001"], _unit(1, seed=1))
+    finally:
+        writer.join(5)
+        gallery.unlink()
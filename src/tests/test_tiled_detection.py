@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("insightface")
+
+from benchmarks.standin import StandInModel
+from face_recognition import FaceAttendanceSystem, _inside_tile
+
+
+def _photo(faces: list, width: int = 2000, height: int = 1000) -> np.ndarray:
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    for x0, y0, x1, y1 in faces:
+        img[y0:y1, x0:x1] = 200
+    return img
+
+
+@pytest.fixture(scope="module")
+def system():
+    system = FaceAttendanceSystem(db_path=None, model_factory=StandInModel, tile_size=1024, tile_overlap=0.2)
+    yield system
+    system.close()
+
+
+def test_face_straddling_tile_edge_is_detected_once(system):
+    # Tiles along x start at 0, 819 and 976; the first face crosses the first
+    # tile's right edge (1024) and the third tile's left edge (976).
+    faces = [(1000, 300, 1120, 420), (100, 100, 180, 180), (1700, 600, 1800, 700)]
+    detected = system._run_detector(_photo(faces), tiled=True)
+
+    assert len(detected) == len(faces)
+    boxes = sorted(tuple(np.round(face.bbox).astype(int)) for face in detected)
+    for box, expected in zip(boxes, sorted(faces)):
+        assert np.allclose(box, expected, atol=4)
+
+
+def test_inside_tile_ignores_image_border():
+    boxes = np.array([[0, 10, 50, 60, 1], [990, 10, 1024, 60, 1], [500, 500, 600, 600, 1]], dtype=np.float32)
+    # The left tile of a 2000px-wide image: x=0 is the image edge, x=1024 is not.
+    assert _inside_tile(boxes, (0, 0, 1024, 1000), (1000, 2000)).tolist() == [True, False, True]
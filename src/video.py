@@ -0,0 +1,123 @@
+"""
+Helpers for multi-frame attendance: frame sampling and face tracking.
+
+An organizer pans a phone across the hall; consecutive frames show mostly
+the same people. The tracker links detections of one physical face across
+frames by box overlap so FaceAttendanceSystem.mark_attendance_frames embeds
+only a few of the sharpest crops per person instead of every detection.
+"""
+
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+
+def sample_video(data: bytes, sample_fps: float = 3.0, max_frames: int = 60):
+    """
+    Yield BGR frames from an encoded video clip at roughly sample_fps.
+
+    OpenCV's video backends only read from files, so the clip is written to a
+    temporary file for the duration of the decode.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+        tmp.write(data)
+        path = tmp.name
+
+    capture = cv2.VideoCapture(path)
+    try:
+        if not capture.isOpened():
+            raise ValueError("Could not decode video")
+
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps / sample_fps))
+        index = yielded = 0
+        # grab() advances without converting the frame; only sampled frames
+        # are retrieved.
+        while yielded < max_frames and capture.grab():
+            if index % step == 0:
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                yielded += 1
+                yield frame
+            index += 1
+    finally:
+        capture.release()
+        os.unlink(path)
+
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class FaceTrack:
+
+    def __init__(self, track_id: int, bbox: np.ndarray):
+        self.track_id = track_id
+        self.bbox = bbox
+        self.missed = 0
+        # (det_score, aligned crop) — the best few detections of this face.
+        self.samples: list = []
+
+    def offer(self, det_score: float, make_crop, max_samples: int):
+        """Keep the detection if it is among the best max_samples so far."""
+        if len(self.samples) < max_samples:
+            self.samples.append((det_score, make_crop()))
+        else:
+            worst = min(range(len(self.samples)), key=lambda i: self.samples[i][0])
+            if det_score <= self.samples[worst][0]:
+                return
+            self.samples[worst] = (det_score, make_crop())
+
+
+class IoUTracker:
+    """Greedy frame-to-frame association of face boxes by IoU."""
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 2):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.tracks: list[FaceTrack] = []
+        self._active: list[FaceTrack] = []
+
+    def update(self, bboxes: np.ndarray) -> list[FaceTrack]:
+        """Assign each box in this frame to a track (new or existing), in order."""
+        assigned: list = [None] * len(bboxes)
+
+        if self._active and len(bboxes):
+            iou = _iou_matrix(np.stack([t.bbox for t in self._active]), bboxes)
+            used = set()
+            # Highest-overlap pairs first; each track and box used once.
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                t, b = np.unravel_index(flat, iou.shape)
+                if iou[t, b] < self.iou_threshold:
+                    break
+                if assigned[b] is None and t not in used:
+                    assigned[b] = self._active[t]
+                    used.add(t)
+
+        for i, bbox in enumerate(bboxes):
+            if assigned[i] is None:
+                assigned[i] = FaceTrack(len(self.tracks), bbox)
+                self.tracks.append(assigned[i])
+            assigned[i].bbox = bbox
+            assigned[i].missed = 0
+
+        seen = {id(track) for track in assigned}
+        for track in self._active:
+            if id(track) not in seen:
+                track.missed += 1
+        self._active = [
+            track for track in {id(t): t for t in self._active + assigned}.values()
+            if track.missed <= self.max_missed
+        ]
+        return assigned